@@ -1,9 +1,19 @@
+import heapq
+import os
 import random
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
+import time
+from array import array
+from collections import deque, namedtuple
 from enum import Enum
 
+from packing_cache import PackingCache, zone_key
+from generation_stats import (ACCEPTED, AREA_EXCEEDED, DUPLICATE, INFEASIBLE_SPLIT,
+                              MIN_ROOMS_UNREACHABLE, TOO_FEW_ROOMS, GenerationResult,
+                              GenerationStats)
+
 class Room:
+    __slots__ = ('id', 'width', 'height', 'x', 'y', 'placed_width', 'placed_height', 'rotated')
+
     def __init__(self, id, width, height):
         self.id = id
         self.width = width
@@ -30,218 +40,1141 @@ class Room:
 
     def copy(self):
         return Room(self.id, self.width, self.height)
+
+
+# Immutable room description shared by every placement of that room
+RoomSpec = namedtuple('RoomSpec', ['id', 'width', 'height'])
+
+
+def room_specs(rooms):
+    return tuple(RoomSpec(r.id, r.width, r.height) for r in rooms)
+
     
 class CorridorType(Enum):
     VERTICAL = 1
     HORIZONTAL = 2
 
 class Corridor:
+    __slots__ = ('pos', 'type', 'start', 'end')
+
     def __init__(self, pos, corridor_type, start, end):
         self.pos = pos
         self.type = corridor_type
         self.start = start
         self.end = end
 
+
+SIGNATURE_MASK = (1 << 64) - 1
+
+
+def _room_term(room_id, x, y, rotated):
+    return hash((room_id, x // 5, y // 5, rotated))
+
+
+def _corridor_term(corridor):
+    return hash((corridor.pos // 5, corridor.type.value))
+
+
 class Layout:
+    """Corridors plus room placements.
+
+    Placements are kept flat in an ``array`` of ``(spec index, x, y, rotated)``
+    quadruples that reference a tuple of ``RoomSpec``s shared by all layouts
+    of a run. ``placed_rooms`` builds ``Room`` views on demand.
+    """
+    __slots__ = ('corridors', 'specs', 'placements', '_signature')
+
     def __init__(self, corridors, placed_rooms):
         self.corridors = corridors
-        self.placed_rooms = placed_rooms
+        self.specs = room_specs(placed_rooms)
+        self.placements = array('i')
+        for i, room in enumerate(placed_rooms):
+            self.placements.extend((i, room.x, room.y, room.rotated))
+        self._signature = None
+
+    @classmethod
+    def from_placements(cls, corridors, specs, placements, signature=None):
+        layout = cls.__new__(cls)
+        layout.corridors = corridors
+        layout.specs = specs
+        layout.placements = placements if isinstance(placements, array) else array('i', placements)
+        layout._signature = signature
+        return layout
+
+    def iter_placements(self):
+        """Yields ``(spec, x, y, rotated)`` in placement order"""
+        p = self.placements
+        for k in range(0, len(p), 4):
+            yield self.specs[p[k]], p[k + 1], p[k + 2], bool(p[k + 3])
+
+    @property
+    def placed_rooms(self):
+        rooms = []
+        for spec, x, y, rotated in self.iter_placements():
+            room = Room(spec.id, spec.width, spec.height)
+            room.place(x, y, rotated)
+            rooms.append(room)
+        return rooms
 
     def get_room_area(self):
-        return sum(room.get_area() for room in self.placed_rooms)
+        return sum(spec.width * spec.height for spec, _, _, _ in self.iter_placements())
 
     def get_signature(self):
-        room_positions = tuple(sorted(
-            (r.id, r.x // 5, r.y // 5, r.rotated) for r in self.placed_rooms
-        ))
-        corridor_positions = tuple(sorted(
-            (c.pos // 5, c.type.value) for c in self.corridors
-        ))
-        return (room_positions, corridor_positions)
-    
+        """64-bit hash of the room and corridor positions quantized to 5 units.
+
+        It is a sum of per-room and per-corridor terms, so it does not depend
+        on placement order and can be built up while rooms are placed (see
+        ``_pack_layout``, which hands it to ``from_placements``).
+        """
+        if self._signature is None:
+            total = sum(_room_term(spec.id, x, y, rotated)
+                        for spec, x, y, rotated in self.iter_placements())
+            total += sum(map(_corridor_term, self.corridors))
+            self._signature = total & SIGNATURE_MASK
+        return self._signature
+
 
 def check_70_condition(rooms, plot_width, plot_height):
     rooms_area = sum(room.get_area() for room in rooms)
     return rooms_area <= plot_width * plot_height * 0.7
 
 
-def place_rooms(rooms, x, y, zone_width, zone_height, randomize=True):
-    placed_rooms = []
-    unplaced_rooms = [r.copy() for r in rooms]
+def _pack_zone_greedy(specs, remaining, x, y, zone_width, zone_height, randomize, rng):
+    """Shelf packer behind place_rooms working on indices into ``specs``.
+
+    Every row scans the remaining rooms in order and places each one that
+    still fits. Returns ``(placements, unplaced)``: ``(index, x, y, rotated)``
+    tuples in placement order and the indices that did not fit.
+    """
+    placements = []
+    unplaced = list(remaining)
 
     if randomize:
-        random.shuffle(unplaced_rooms)
+        rng.shuffle(unplaced)
 
     curr_y = y
 
-    while unplaced_rooms and curr_y < y + zone_height:
+    while unplaced and curr_y < y + zone_height:
         curr_x = x
         row_ht = 0
-        placed_in_row = False
-        i = 0
+        # Rooms left over for the next row; rebuilding the list per row avoids
+        # the O(n) list.pop for every placed room
+        skipped = []
 
-        while i < len(unplaced_rooms):
-            room = unplaced_rooms[i]
+        for i in unplaced:
+            room = specs[i]
             room_placed = False
 
             orientations = [(False, room.width, room.height),
                           (True, room.height, room.width)]
 
-            if randomize and random.random() < 0.5:
+            if randomize and rng.random() < 0.5:
                 orientations.reverse()
 
             for rotated, w, h in orientations:
                 if (curr_x + w <= zone_width + x and
                     curr_y + h <= zone_height + y):
-                    room.place(curr_x, curr_y, rotated)
-                    placed_rooms.append(room)
+                    placements.append((i, curr_x, curr_y, rotated))
                     curr_x += w
                     row_ht = max(row_ht, h)
-                    unplaced_rooms.pop(i)
                     room_placed = True
-                    placed_in_row = True
                     break
 
             if not room_placed:
-                i += 1
+                skipped.append(i)
+
+        if len(skipped) == len(unplaced):
+            break
+
+        unplaced = skipped
+        curr_y += row_ht
+
+    return placements, unplaced
+
+
+def _pack_zone_indexed(specs, remaining, x, y, zone_width, zone_height, randomize, rng):
+    """Indexed variant of _pack_zone_greedy.
+
+    Remaining rooms sit in a min segment tree over their (shuffled) order,
+    keyed by the narrowest width they can take under the height left in the
+    zone, so "the next room that fits in the rest of the row" is found in
+    O(log n) instead of by a linear scan. Keys are only recomputed once the
+    height left drops below the tallest remaining side. Placements are
+    identical to the greedy packer for ``randomize=False``; with
+    randomization the orientation coin is only drawn for rooms that actually
+    get placed, so the RNG stream (and hence the layouts for a given seed)
+    differ.
+
+    The greedy packer rescans every remaining room on each row, which is
+    cheap while a zone is offered few rooms. This one pays off on programs
+    far larger than a zone can hold: on 1000-2000 rooms of 4-12 units on a
+    400x300 or 600x500 plot it runs 1.7-2x as many attempts per second
+    (``bench.py`` ``crowded.packers``), while on the 200-room ``large``
+    scenario the two are even and on small programs greedy is faster.
+    """
+    order = list(remaining)
+    if randomize:
+        rng.shuffle(order)
+    n = len(order)
+    if not n:
+        return [], []
+
+    inf = float('inf')
+    size = 1
+    while size < n:
+        size *= 2
+    tree = [inf] * (2 * size)
+    placed = [False] * n
+
+    def rebuild(height_left):
+        """Re-key every unplaced room for ``height_left``; returns the tallest side still usable"""
+        tallest = 0
+        for pos in range(n):
+            key = inf
+            if not placed[pos]:
+                room = specs[order[pos]]
+                w, h = room.width, room.height
+                if h <= height_left:
+                    key = w
+                    tallest = max(tallest, h)
+                if w <= height_left:
+                    key = min(key, h)
+                    tallest = max(tallest, w)
+            tree[size + pos] = key
+        for node in range(size - 1, 0, -1):
+            left, right = tree[2 * node], tree[2 * node + 1]
+            tree[node] = left if left < right else right
+        return tallest
+
+    height_left = zone_height
+    tallest = rebuild(height_left)
+    placements = []
+    curr_y = y
+
+    while curr_y < y + zone_height:
+        curr_x = x
+        row_ht = 0
+        width_left = zone_width
+        placed_in_row = False
+
+        while tree[1] <= width_left:
+            node = 1
+            while node < size:
+                node = 2 * node if tree[2 * node] <= width_left else 2 * node + 1
+            pos = node - size
+
+            room = specs[order[pos]]
+            orientations = [(False, room.width, room.height),
+                          (True, room.height, room.width)]
+            if randomize and rng.random() < 0.5:
+                orientations.reverse()
+            for rotated, w, h in orientations:
+                if w <= width_left and h <= height_left:
+                    break
+
+            placements.append((order[pos], curr_x, curr_y, rotated))
+            placed[pos] = True
+            tree[node] = inf
+            node //= 2
+            while node:
+                left, right = tree[2 * node], tree[2 * node + 1]
+                tree[node] = left if left < right else right
+                node //= 2
+            curr_x += w
+            width_left -= w
+            row_ht = max(row_ht, h)
+            placed_in_row = True
 
         if not placed_in_row:
             break
 
         curr_y += row_ht
+        height_left -= row_ht
+        if height_left < tallest:
+            tallest = rebuild(height_left)
+
+    return placements, [order[pos] for pos in range(n) if not placed[pos]]
+
+
+# Zones with more candidate rooms than this are packed greedily by 'exact'
+EXACT_MAX_ROOMS = 7
+# Shelf sub-problems of the 'exact' packer, whole zones included; per
+# process and bounded
+SHELF_CACHE = PackingCache(max_entries=200000)
+
+
+def _shelf_bound(width, height, max_row, rooms):
+    """Upper bound on ``(count, area)`` for shelves of at most ``max_row``
+    height in a ``width`` x ``height`` zone"""
+    fitting = sorted(a * b for a, b in rooms
+                     if (a <= width and b <= min(height, max_row)) or
+                        (b <= width and a <= min(height, max_row)))
+    capacity = width * height
+    count = 0
+    used = 0
+    for area in fitting:
+        if used + area > capacity:
+            break
+        used += area
+        count += 1
+    return count, min(capacity, sum(fitting))
 
-    return placed_rooms, unplaced_rooms
 
+def _solve_shelves(width, height, max_row, rooms):
+    """Best shelf packing of ``rooms`` (a sorted tuple of ``(short, long)``
+    sides) into ``width`` x ``height``, with rows no taller than ``max_row``.
 
-def generate_layouts(rooms, plot_width, plot_height, max_layouts=10, max_attempts=500):
-    """Generate multiple diverse layouts with RECURSIVE corridor placement"""
-    CORRIDOR_WIDTH = 3
-    MIN_ZONE_DIM = min([min(r.width, r.height) for r in rooms])
-    layouts = []
-    seen_signatures = set()
-    attempts = 0
+    Maximizes rooms placed, then area. Returns ``(count, area, rows)`` where
+    each row is a tuple of ``(room, placed width, placed height)``. Rows are
+    built in non-increasing height (any row order packs the same rooms), a
+    row that could still take another room is skipped (moving that room
+    into it never hurts), and rows are pruned against ``_shelf_bound``.
+    Memoized in ``SHELF_CACHE``, so identical sub-problems are solved once.
+    """
+    key = (width, height, max_row, rooms)
+    cached = SHELF_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    best = (0, 0, ())
+    n = len(rooms)
+    row_limit = min(height, max_row)
+    chosen = []
+
+    def extend(i, used_w, row_h):
+        nonlocal best
+        if i == n:
+            if not chosen:
+                return
+            picked = {j for j, _, _ in chosen}
+            for j in range(n):
+                if j not in picked:
+                    a, b = rooms[j]
+                    if ((a <= width - used_w and b <= row_h) or
+                            (b <= width - used_w and a <= row_h)):
+                        return
+            rest = tuple(rooms[j] for j in range(n) if j not in picked)
+            count = len(chosen)
+            area = sum(rooms[j][0] * rooms[j][1] for j, _, _ in chosen)
+            bound_count, bound_area = _shelf_bound(width, height - row_h, row_h, rest)
+            if (count + bound_count, area + bound_area) <= best[:2]:
+                return
+            sub = _solve_shelves(width, height - row_h, row_h, rest)
+            if (count + sub[0], area + sub[1]) > best[:2]:
+                row = tuple((rooms[j], w, h) for j, w, h in chosen)
+                best = (count + sub[0], area + sub[1], (row,) + sub[2])
+            return
+
+        extend(i + 1, used_w, row_h)
+        # Identical rooms are taken in order, so each choice is tried once
+        if i > 0 and rooms[i] == rooms[i - 1] and (not chosen or chosen[-1][0] != i - 1):
+            return
+        a, b = rooms[i]
+        for w, h in ((a, b), (b, a)) if a != b else ((a, b),):
+            if used_w + w <= width and h <= row_limit:
+                chosen.append((i, w, h))
+                extend(i + 1, used_w + w, max(row_h, h))
+                chosen.pop()
+
+    extend(0, 0, 0)
+    SHELF_CACHE.put(key, best)
+    return best
+
+
+def _pack_zone_exact(specs, remaining, x, y, zone_width, zone_height, randomize, rng):
+    """Optimal shelf packing for zones with few candidate rooms.
+
+    Rooms that fit the zone at all are handed to ``_solve_shelves`` as a
+    multiset of sides (the zone's ``zone_key``). ``_solve_shelves`` memoizes
+    on that, so a zone of the same size with the same candidate rooms is
+    never solved twice, across attempts and seeds.
+    With more than ``EXACT_MAX_ROOMS`` candidates the zone is packed by
+    ``_pack_zone_greedy`` instead. ``randomize`` only decides which of
+    several identical rooms is used.
+    """
+    order = list(remaining)
+    fitting = [i for i in order
+               if (specs[i].width <= zone_width and specs[i].height <= zone_height) or
+                  (specs[i].height <= zone_width and specs[i].width <= zone_height)]
+    if len(fitting) > EXACT_MAX_ROOMS:
+        return _pack_zone_greedy(specs, order, x, y, zone_width, zone_height, randomize, rng)
+    if randomize:
+        rng.shuffle(fitting)
+
+    by_sides = {}
+    for i in fitting:
+        room = specs[i]
+        by_sides.setdefault((min(room.width, room.height), max(room.width, room.height)), []).append(i)
+    key = zone_key(zone_width, zone_height, [sides for sides, indices in by_sides.items()
+                                             for _ in indices])
+    rows = _solve_shelves(zone_width, zone_height, zone_height, key[2])[2]
+
+    placements = []
+    used = set()
+    curr_y = y
+    for row in rows:
+        curr_x = x
+        row_ht = 0
+        for sides, w, h in row:
+            i = by_sides[sides].pop()
+            placements.append((i, curr_x, curr_y, specs[i].width != w))
+            used.add(i)
+            curr_x += w
+            row_ht = max(row_ht, h)
+        curr_y += row_ht
 
-    def recursively_split_zone(x, y, width, height, depth=0, max_depth=4):
-        """Recursively split a zone into smaller zones with corridors"""
-        corridors = []
-        zones = []
+    return placements, [i for i in order if i not in used]
 
-        if depth >= max_depth:
-            return corridors, [(x, y, width, height)]
 
-        can_split_h = height > 2 * MIN_ZONE_DIM + CORRIDOR_WIDTH
-        can_split_v = width > 2 * MIN_ZONE_DIM + CORRIDOR_WIDTH
+PACKERS = {
+    'greedy': _pack_zone_greedy,
+    'indexed': _pack_zone_indexed,
+    'exact': _pack_zone_exact,
+}
+
 
-        if not can_split_h and not can_split_v:
+def _pack_zone(specs, remaining, x, y, zone_width, zone_height, randomize, rng, packer='greedy'):
+    """Pack one zone with the named packer from ``PACKERS``"""
+    return PACKERS[packer](specs, remaining, x, y, zone_width, zone_height, randomize, rng)
+
+
+def place_rooms(rooms, x, y, zone_width, zone_height, randomize=True, rng=None, packer='greedy'):
+    if rng is None:
+        rng = random
+    placements, unplaced = _pack_zone(rooms, range(len(rooms)), x, y,
+                                      zone_width, zone_height, randomize, rng, packer)
+
+    placed_rooms = []
+    for i, px, py, rotated in placements:
+        room = rooms[i].copy()
+        room.place(px, py, rotated)
+        placed_rooms.append(room)
+
+    return placed_rooms, [rooms[i].copy() for i in unplaced]
+
+
+CORRIDOR_WIDTH = 3
+
+
+def recursively_split_zone(x, y, width, height, min_zone_dim, rng, depth=0, max_depth=4,
+                           split_base=0.8, h_bias=0.6):
+    """Recursively split a zone into smaller zones with corridors.
+
+    A zone at ``depth`` is split with probability ``split_base - depth * 0.15``;
+    when both directions are possible the split is horizontal with
+    probability ``h_bias`` on even depths and ``1 - h_bias`` on odd ones.
+    """
+    corridors = []
+    zones = []
+
+    if depth >= max_depth:
+        return corridors, [(x, y, width, height)]
+
+    can_split_h = height > 2 * min_zone_dim + CORRIDOR_WIDTH
+    can_split_v = width > 2 * min_zone_dim + CORRIDOR_WIDTH
+
+    if not can_split_h and not can_split_v:
+        return corridors, [(x, y, width, height)]
+
+    split_probability = split_base - (depth * 0.15)
+    if rng.random() > split_probability:
+        return corridors, [(x, y, width, height)]
+
+    if can_split_h and can_split_v:
+        if depth % 2 == 0:
+            split_horizontal = rng.random() < h_bias
+        else:
+            split_horizontal = rng.random() < 1 - h_bias
+    elif can_split_h:
+        split_horizontal = True
+    else:
+        split_horizontal = False
+
+    if split_horizontal:
+        min_pos = min_zone_dim
+        max_pos = height - CORRIDOR_WIDTH - min_zone_dim
+        if max_pos <= min_pos:
             return corridors, [(x, y, width, height)]
 
-        split_probability = 0.8 - (depth * 0.15)
-        if random.random() > split_probability:
+        split_pos = rng.randint(min_pos, max_pos)
+        corridor = Corridor(y + split_pos, CorridorType.HORIZONTAL, x, x + width)
+        corridors.append(corridor)
+
+        top_corridors, top_zones = recursively_split_zone(
+            x, y, width, split_pos, min_zone_dim, rng, depth + 1, max_depth,
+            split_base, h_bias
+        )
+        bottom_corridors, bottom_zones = recursively_split_zone(
+            x, y + split_pos + CORRIDOR_WIDTH, width,
+            height - split_pos - CORRIDOR_WIDTH, min_zone_dim, rng, depth + 1, max_depth,
+            split_base, h_bias
+        )
+
+        corridors.extend(top_corridors)
+        corridors.extend(bottom_corridors)
+        zones.extend(top_zones)
+        zones.extend(bottom_zones)
+
+    else:
+        min_pos = min_zone_dim
+        max_pos = width - CORRIDOR_WIDTH - min_zone_dim
+        if max_pos <= min_pos:
             return corridors, [(x, y, width, height)]
 
-        if can_split_h and can_split_v:
-            if depth % 2 == 0:
-                split_horizontal = random.random() < 0.6
-            else:
-                split_horizontal = random.random() < 0.4
-        elif can_split_h:
-            split_horizontal = True
-        else:
-            split_horizontal = False
-
-        if split_horizontal:
-            min_pos = MIN_ZONE_DIM
-            max_pos = height - CORRIDOR_WIDTH - MIN_ZONE_DIM
-            if max_pos <= min_pos:
-                return corridors, [(x, y, width, height)]
-
-            split_pos = random.randint(min_pos, max_pos)
-            corridor = Corridor(y + split_pos, CorridorType.HORIZONTAL, x, x + width)
-            corridors.append(corridor)
-
-            top_corridors, top_zones = recursively_split_zone(
-                x, y, width, split_pos, depth + 1, max_depth
-            )
-            bottom_corridors, bottom_zones = recursively_split_zone(
-                x, y + split_pos + CORRIDOR_WIDTH, width,
-                height - split_pos - CORRIDOR_WIDTH, depth + 1, max_depth
-            )
-
-            corridors.extend(top_corridors)
-            corridors.extend(bottom_corridors)
-            zones.extend(top_zones)
-            zones.extend(bottom_zones)
+        split_pos = rng.randint(min_pos, max_pos)
+        corridor = Corridor(x + split_pos, CorridorType.VERTICAL, y, y + height)
+        corridors.append(corridor)
 
-        else:
-            min_pos = MIN_ZONE_DIM
-            max_pos = width - CORRIDOR_WIDTH - MIN_ZONE_DIM
-            if max_pos <= min_pos:
-                return corridors, [(x, y, width, height)]
-
-            split_pos = random.randint(min_pos, max_pos)
-            corridor = Corridor(x + split_pos, CorridorType.VERTICAL, y, y + height)
-            corridors.append(corridor)
-
-            left_corridors, left_zones = recursively_split_zone(
-                x, y, split_pos, height, depth + 1, max_depth
-            )
-            right_corridors, right_zones = recursively_split_zone(
-                x + split_pos + CORRIDOR_WIDTH, y,
-                width - split_pos - CORRIDOR_WIDTH, height, depth + 1, max_depth
-            )
-
-            corridors.extend(left_corridors)
-            corridors.extend(right_corridors)
-            zones.extend(left_zones)
-            zones.extend(right_zones)
-
-        return corridors, zones
-
-    def try_layout_with_corridors(seed):
-        random.seed(seed)
-
-        max_depth = random.randint(3, 5)
-        corridors, zones = recursively_split_zone(
-            0, 0, plot_width, plot_height, depth=0, max_depth=max_depth
+        left_corridors, left_zones = recursively_split_zone(
+            x, y, split_pos, height, min_zone_dim, rng, depth + 1, max_depth,
+            split_base, h_bias
+        )
+        right_corridors, right_zones = recursively_split_zone(
+            x + split_pos + CORRIDOR_WIDTH, y,
+            width - split_pos - CORRIDOR_WIDTH, height, min_zone_dim, rng, depth + 1, max_depth,
+            split_base, h_bias
         )
 
-        all_placed_rooms = []
-        remaining_rooms = [r.copy() for r in rooms]
-        random.shuffle(zones)
+        corridors.extend(left_corridors)
+        corridors.extend(right_corridors)
+        zones.extend(left_zones)
+        zones.extend(right_zones)
 
-        for x, y, width, height in zones:
-            if not remaining_rooms:
-                break
+    return corridors, zones
 
-            placed, remaining_rooms = place_rooms(
-                remaining_rooms, x, y, width, height, randomize=True
-            )
-            all_placed_rooms.extend(placed)
 
-        if all_placed_rooms and check_70_condition(all_placed_rooms, plot_width, plot_height):
-            return Layout(corridors, all_placed_rooms)
+def _smallest_area_sum(rooms, count):
+    """Total area of the ``count`` smallest rooms"""
+    if count <= 0:
+        return 0
+    return sum(sorted(r.width * r.height for r in rooms)[:count])
 
-        return None
 
-    print(f"Attempting to generate up to {max_layouts} unique layouts...")
-    while len(layouts) < max_layouts and attempts < max_attempts:
-        seed = attempts
-        layout = try_layout_with_corridors(seed)
+def is_feasible_split(zones, rooms, min_rooms=1):
+    """Cheap pre-pass: can these zones possibly hold ``min_rooms`` of ``rooms``?
 
+    Rejects a split when fewer than ``min_rooms`` rooms fit into any zone in
+    either orientation, or when the total zone area is smaller than the area
+    of the smallest rooms that would still have to be placed.
+    """
+    fitting = [r for r in rooms
+               if any((r.width <= w and r.height <= h) or (r.height <= w and r.width <= h)
+                      for _, _, w, h in zones)]
+    if len(fitting) < min_rooms:
+        return False
+    zone_area = sum(w * h for _, _, w, h in zones)
+    return zone_area >= _smallest_area_sum(fitting, min_rooms)
+
+
+def _split_plot(specs, plot_width, plot_height, rng, split=None):
+    """Corridors and zones for one attempt; ``split`` is a ``(max_depth,
+    split_base, h_bias)`` choice from ``split_bandit``, else the depth is drawn
+    from 3-5 and the other two keep their defaults"""
+    min_zone_dim = min([min(r.width, r.height) for r in specs])
+    if split is None:
+        max_depth = rng.randint(3, 5)
+        return recursively_split_zone(
+            0, 0, plot_width, plot_height, min_zone_dim, rng, depth=0, max_depth=max_depth
+        )
+    max_depth, split_base, h_bias = split
+    return recursively_split_zone(
+        0, 0, plot_width, plot_height, min_zone_dim, rng, depth=0, max_depth=max_depth,
+        split_base=split_base, h_bias=h_bias
+    )
+
+
+def _nothing_fits(specs, remaining, zones):
+    """True when none of the ``remaining`` rooms fits any of ``zones``"""
+    for _, _, w, h in zones:
+        for i in remaining:
+            room = specs[i]
+            if (room.width <= w and room.height <= h) or (room.height <= w and room.width <= h):
+                return False
+    return True
+
+
+def _pack_layout(specs, corridors, zones, plot_width, plot_height, rng, min_rooms, packer,
+                 seen=None):
+    """Returns ``(layout, outcome)``; ``outcome`` is one of the attempt
+    outcomes named in ``generation_stats``.
+
+    The layout signature is summed up as rooms are placed. Once no remaining
+    room fits a remaining zone the layout is final, so if its signature is
+    already in ``seen`` the attempt is abandoned as a duplicate.
+    """
+    if not is_feasible_split(zones, specs, min_rooms):
+        return None, INFEASIBLE_SPLIT
+
+    max_area = plot_width * plot_height * 0.7
+    placements = array('i')
+    placed_count = 0
+    placed_area = 0
+    remaining = range(len(specs))
+    rng.shuffle(zones)
+    zone_area_left = sum(w * h for _, _, w, h in zones)
+    signature = sum(map(_corridor_term, corridors))
+
+    for k, (x, y, width, height) in enumerate(zones):
+        if not remaining:
+            break
+
+        placed, remaining = _pack_zone(specs, remaining, x, y, width, height, True, rng, packer)
+        for placement in placed:
+            placements.extend(placement)
+            room = specs[placement[0]]
+            placed_area += room.width * room.height
+            signature += _room_term(room.id, placement[1], placement[2], placement[3])
+        placed_count += len(placed)
+        zone_area_left -= width * height
+
+        # Stop packing as soon as the target is out of reach: the area cap is
+        # already blown, or the zones left cannot hold the rooms still needed
+        if placed_area > max_area:
+            return None, AREA_EXCEEDED
+        needed = min_rooms - placed_count
+        if needed > 0 and zone_area_left < _smallest_area_sum([specs[i] for i in remaining], needed):
+            return None, MIN_ROOMS_UNREACHABLE
+        if (seen and (signature & SIGNATURE_MASK) in seen and
+                _nothing_fits(specs, remaining, zones[k + 1:])):
+            return None, DUPLICATE
+
+    if placed_count >= max(min_rooms, 1) and placed_area <= max_area:
+        layout = Layout.from_placements(corridors, specs, placements, signature & SIGNATURE_MASK)
+        return layout, ACCEPTED
+
+    return None, TOO_FEW_ROOMS
+
+
+def _build_layout(specs, plot_width, plot_height, rng, min_rooms=1, packer='greedy', stats=None,
+                  seen=None, split=None):
+    """Returns ``(layout, pruned)``; ``pruned`` is True when the attempt was abandoned early.
+    Layouts whose signature is in ``seen`` may be abandoned before they are finished.
+    ``split`` overrides the split parameters (see ``_split_plot``).
+    Stage timings and the outcome go to ``stats`` when one is given."""
+    if stats is None:
+        corridors, zones = _split_plot(specs, plot_width, plot_height, rng, split)
+        layout, outcome = _pack_layout(specs, corridors, zones, plot_width, plot_height, rng,
+                                       min_rooms, packer, seen)
+    else:
+        start = time.perf_counter()
+        corridors, zones = _split_plot(specs, plot_width, plot_height, rng, split)
+        split_done = time.perf_counter()
+        layout, outcome = _pack_layout(specs, corridors, zones, plot_width, plot_height, rng,
+                                       min_rooms, packer, seen)
+        stats.record_attempt(split_done - start, time.perf_counter() - split_done, outcome)
+    return layout, outcome not in (ACCEPTED, TOO_FEW_ROOMS)
+
+
+def try_layout_with_corridors(rooms, plot_width, plot_height, seed=None, rng=None, min_rooms=1,
+                              packer='greedy'):
+    """Build one candidate layout.
+
+    All randomness comes from ``rng`` (a ``random.Random``); when it is not
+    given a fresh one is created from ``seed``, so the same seed always yields
+    the same layout no matter what other threads are doing. Layouts placing
+    fewer than ``min_rooms`` rooms are rejected.
+    """
+    if rng is None:
+        rng = random.Random(seed)
+    layout, _ = _build_layout(room_specs(rooms), plot_width, plot_height, rng, min_rooms, packer)
+    return layout
+
+
+def _search_seed_range(rooms, plot_width, plot_height, start, stop, min_rooms=1, packer='greedy',
+                       with_stats=False):
+    """Worker entry point: unique layouts for seeds in [start, stop), in seed order,
+    the number of pruned attempts and, if ``with_stats``, the chunk's ``GenerationStats``.
+    Near-duplicates are left to the merge, which sees layouts in seed order."""
+    found = []
+    seen_signatures = set()
+    pruned = 0
+    specs = room_specs(rooms)
+    stats = GenerationStats() if with_stats else None
+    for seed in range(start, stop):
+        layout, was_pruned = _build_layout(specs, plot_width, plot_height,
+                                           random.Random(seed), min_rooms, packer, stats,
+                                           seen_signatures)
+        pruned += was_pruned
         if layout:
-            signature = layout.get_signature()
+            signature = layout.get_signature() if stats is None else stats.signature(layout)
             if signature not in seen_signatures:
-                layouts.append(layout)
+                found.append(layout)
                 seen_signatures.add(signature)
+            elif stats is not None:
+                stats.duplicates += 1
+    return found, pruned, stats
+
+
+def _load_signature(value):
+    """Signature from a saved state; states written before signatures were
+    64-bit hashes hold ``[room_positions, corridor_positions]`` lists"""
+    if isinstance(value, int):
+        return value
+    rooms, corridors = value
+    return sum(hash(tuple(item)) for item in rooms + corridors) & SIGNATURE_MASK
+
+
+class LayoutGenerator:
+    """Resumable layout search.
+
+    Holds the signatures seen so far and the next seed to try, so asking for
+    more layouts with ``next(k)`` only pays for the new ones. ``to_state`` /
+    ``from_state`` round-trip the whole search through plain JSON data.
+    Attempts are recorded in ``stats`` (a ``GenerationStats``) if it is set.
+
+    With ``min_distance`` (a fraction of the plot, see ``similarity``) layouts
+    closer than that to one already yielded are skipped as near-duplicates.
+    The similarity index is not part of the saved state; ``remember`` rebuilds
+    it from the layouts already shown.
+
+    With ``adaptive`` the split parameters of each attempt are picked by a
+    ``split_bandit.SplitBandit`` that learns which settings yield new
+    layouts; it is saved with the state, so resumed runs stay reproducible.
+    """
+
+    def __init__(self, rooms, plot_width, plot_height, seed=0, min_rooms=1, packer='greedy',
+                 stats=None, min_distance=None, adaptive=False):
+        self.specs = room_specs(rooms)
+        self.plot_width = plot_width
+        self.plot_height = plot_height
+        self.min_rooms = min_rooms
+        self.packer = packer
+        self.next_seed = seed
+        self.seen_signatures = set()
+        self.attempts = 0
+        self.pruned = 0
+        self.stats = stats
+        self.min_distance = min_distance
+        self.index = None
+        if min_distance:
+            from similarity import SimilarityIndex
+
+            self.index = SimilarityIndex(plot_width, plot_height, min_distance)
+        self.bandit = None
+        if adaptive:
+            from split_bandit import SplitBandit
+
+            self.bandit = SplitBandit()
+
+    def iter(self, max_attempts=None, deadline=None, should_stop=None):
+        """Yield each new unique layout as soon as it is found.
+
+        Stops after ``max_attempts`` seeds, once ``time.monotonic()`` passes
+        ``deadline`` or once the ``should_stop()`` callable returns true (it
+        is checked before every attempt); runs forever when all are None.
+        Counters are advanced before yielding, so abandoning the iterator at
+        any point leaves the generator ready to resume.
+        """
+        stop = None if max_attempts is None else self.next_seed + max_attempts
+        stats = self.stats
+
+        while stop is None or self.next_seed < stop:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            if should_stop is not None and should_stop():
+                break
+            seed = self.next_seed
+            self.next_seed += 1
+            self.attempts += 1
+
+            arm = split = None
+            if self.bandit is not None:
+                arm = self.bandit.choose(seed)
+                split = self.bandit.arms[arm]
+            layout, was_pruned = _build_layout(self.specs, self.plot_width, self.plot_height,
+                                               random.Random(seed), self.min_rooms, self.packer,
+                                               stats, self.seen_signatures, split)
+            self.pruned += was_pruned
+            is_new = layout is not None and self._admit(layout)
+            if arm is not None:
+                self.bandit.update(arm, layout is not None, is_new)
+            if is_new:
+                yield layout
+
+    def _admit(self, layout):
+        """Record ``layout`` and return True unless it is a (near-)duplicate"""
+        stats = self.stats
+        signature = layout.get_signature() if stats is None else stats.signature(layout)
+        if signature in self.seen_signatures:
+            if stats is not None:
+                stats.duplicates += 1
+            return False
+        self.seen_signatures.add(signature)
+        if self.index is not None and not self.index.admit(layout):
+            if stats is not None:
+                stats.near_duplicates += 1
+            return False
+        return True
+
+    def remember(self, layouts):
+        """Treat ``layouts`` as already yielded"""
+        for layout in layouts:
+            self.seen_signatures.add(layout.get_signature())
+            if self.index is not None:
+                self.index.add(layout)
+
+    def next(self, k, max_attempts=None):
+        """Return up to ``k`` layouts not returned before, trying at most
+        ``max_attempts`` seeds (``50 * k`` by default)"""
+        if max_attempts is None:
+            max_attempts = k * 50
+        layouts = []
+        if k <= 0:
+            return layouts
+
+        for layout in self.iter(max_attempts):
+            layouts.append(layout)
+            if len(layouts) % 10 == 0:
+                print(f"  Generated {len(layouts)} layouts so far...")
+            if len(layouts) >= k:
+                break
+
+        return layouts
+
+    def to_state(self):
+        return {
+            "rooms": [list(spec) for spec in self.specs],
+            "plot_width": self.plot_width,
+            "plot_height": self.plot_height,
+            "min_rooms": self.min_rooms,
+            "packer": self.packer,
+            "next_seed": self.next_seed,
+            "attempts": self.attempts,
+            "pruned": self.pruned,
+            "min_distance": self.min_distance,
+            "bandit": None if self.bandit is None else self.bandit.to_state(),
+            "seen_signatures": list(self.seen_signatures),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        generator = cls([RoomSpec(*spec) for spec in state["rooms"]],
+                        state["plot_width"], state["plot_height"], seed=state["next_seed"],
+                        min_rooms=state["min_rooms"], packer=state["packer"],
+                        min_distance=state.get("min_distance"))
+        if state.get("bandit") is not None:
+            from split_bandit import SplitBandit
+
+            generator.bandit = SplitBandit.from_state(state["bandit"])
+        generator.attempts = state["attempts"]
+        generator.pruned = state["pruned"]
+        generator.seen_signatures = {_load_signature(s) for s in state["seen_signatures"]}
+        return generator
+
+
+def _layout_rank(layout):
+    """Quality used to keep the best layouts: rooms placed, then room area"""
+    return len(layout.placements) // 4, layout.get_room_area()
+
+
+def search_until(generator, max_layouts, deadline, should_stop=None, on_improve=None):
+    """Anytime search: keep the best ``max_layouts`` unique layouts found
+    before ``time.monotonic()`` reaches ``deadline``.
+
+    Once ``max_layouts`` are held, the generator's ``min_rooms`` is raised to
+    the room count of the worst one kept, so attempts that cannot compete
+    are pruned early and the rest of the budget goes to better candidates.
+    No attempt is started when the mean attempt time so far would overrun
+    the deadline. Returns ``(layouts, deadline_hit)``, best first;
+    ``deadline_hit`` is False when the search ended on its own (every kept
+    layout places all rooms, or ``should_stop()`` returned true). The search
+    is timed into the generator's stats, if it has any.
+
+    ``on_improve(layouts)`` is called with the layouts kept so far, best
+    first, each time that set changes, so a caller can publish partial
+    results while the search runs.
+    """
+    if max_layouts <= 0:
+        return [], False
+    if generator.stats is not None:
+        with generator.stats.measure():
+            return _search_until(generator, max_layouts, deadline, should_stop, on_improve)
+    return _search_until(generator, max_layouts, deadline, should_stop, on_improve)
+
+
+def _ranked(best):
+    return [layout for _, _, layout in sorted(best, key=lambda e: e[:2], reverse=True)]
+
+
+def _search_until(generator, max_layouts, deadline, should_stop, on_improve):
+    best = []  # min-heap of (rank, -order, layout); ties keep the earlier layout
+    most = (len(generator.specs), sum(spec.width * spec.height for spec in generator.specs))
+    base_min_rooms = generator.min_rooms
+    start = time.monotonic()
+    first_attempt = generator.attempts
+    deadline_hit = False
+
+    def out_of_time():
+        nonlocal deadline_hit
+        now = time.monotonic()
+        done = generator.attempts - first_attempt
+        mean = (now - start) / done if done else 0.0
+        deadline_hit = now + mean >= deadline
+        return deadline_hit or (should_stop is not None and should_stop())
+
+    try:
+        for order, layout in enumerate(generator.iter(should_stop=out_of_time)):
+            entry = (_layout_rank(layout), -order, layout)
+            if len(best) < max_layouts:
+                heapq.heappush(best, entry)
+            elif entry[:2] > best[0][:2]:
+                heapq.heapreplace(best, entry)
+            else:
+                continue
+            if on_improve is not None:
+                on_improve(_ranked(best))
+            if len(best) == max_layouts:
+                if best[0][0] == most:
+                    break
+                generator.min_rooms = max(base_min_rooms, best[0][0][0])
+    finally:
+        generator.min_rooms = base_min_rooms
+
+    return _ranked(best), deadline_hit
+
+
+def iter_layouts(rooms, plot_width, plot_height, max_layouts=None, max_attempts=None,
+                 time_budget=None, seed=0, min_rooms=1, packer='greedy', min_distance=None,
+                 adaptive=False):
+    """Stream unique layouts as they are found.
+
+    Stops after ``max_layouts`` layouts, ``max_attempts`` attempts or
+    ``time_budget`` seconds, whichever comes first; any of them may be None.
+    Closing the iterator stops the search.
+    """
+    generator = LayoutGenerator(rooms, plot_width, plot_height, seed=seed,
+                                min_rooms=min_rooms, packer=packer, min_distance=min_distance,
+                                adaptive=adaptive)
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    if max_layouts is not None and max_layouts <= 0:
+        return
+
+    for count, layout in enumerate(generator.iter(max_attempts, deadline), 1):
+        yield layout
+        if max_layouts is not None and count >= max_layouts:
+            return
+
+
+# 'scalar' builds one attempt at a time from its own seed; 'batch' is batch_engine
+ENGINES = ('scalar', 'batch')
+
+
+def generate_layouts(rooms, plot_width, plot_height, max_layouts=10, max_attempts=500, workers=None,
+                     seed=0, min_rooms=1, packer='greedy', cache=None, stats=None,
+                     min_distance=None, deadline_ms=None, adaptive=False, engine='scalar'):
+    """Generate multiple diverse layouts with RECURSIVE corridor placement
+
+    Attempt ``i`` uses seed ``seed + i``, so a result can be reproduced from
+    ``(seed, inputs)``. With ``workers`` > 1 the seed range is spread across a
+    process pool; the result is identical to the serial search over the same
+    seeds. Only layouts placing at least ``min_rooms`` rooms are kept.
+    ``packer`` names the zone packer in ``PACKERS``. A ``cache``
+    (``layout_cache.LayoutCache``) is consulted before searching and filled
+    afterwards. With a ``stats`` (``generation_stats.GenerationStats``) the
+    search is instrumented and the result is a ``GenerationResult``, a list
+    carrying the stats as ``.stats``. With ``min_distance`` layouts closer
+    than that to an earlier one are skipped (see ``similarity``).
+
+    With ``deadline_ms`` the search is bounded by time instead of
+    ``max_attempts``: it runs serially until the deadline (see
+    ``search_until``) and returns a ``GenerationResult`` holding the best
+    layouts found, best first, with ``deadline_hit`` telling whether time ran
+    out. Such results depend on machine speed, so they are never cached.
+
+    With ``adaptive`` the split parameters are tuned during the run by a
+    bandit (see ``split_bandit``); the learned parameters are printed and
+    stored in ``stats.split_params``. The bandit learns from attempts in
+    order, so adaptive runs are serial (``workers`` is ignored) and still
+    reproducible from ``seed``.
+
+    ``engine='batch'`` evaluates candidates thousands at a time with NumPy
+    (see ``batch_engine``): several times the attempts per second, but a seed
+    gives other layouts than the scalar search. It only runs the greedy packer
+    and does not take ``min_distance``, ``deadline_ms``, ``adaptive`` or
+    ``stats``; ``workers`` is ignored.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine {engine!r}")
+    if engine == 'batch' and (packer != 'greedy' or min_distance is not None or
+                              deadline_ms is not None or adaptive or stats is not None):
+        raise ValueError("engine='batch' supports only the greedy packer, without min_distance, "
+                         "deadline_ms, adaptive or stats")
+
+    if deadline_ms is not None:
+        generator = LayoutGenerator(rooms, plot_width, plot_height, seed=seed,
+                                    min_rooms=min_rooms, packer=packer, stats=stats,
+                                    min_distance=min_distance, adaptive=adaptive)
+        deadline = time.monotonic() + deadline_ms / 1000
+        print(f"Searching for up to {max_layouts} layouts for {deadline_ms} ms...")
+        layouts, deadline_hit = search_until(generator, max_layouts, deadline)
+        print(f"  {generator.attempts} attempts: {generator.pruned} pruned early, "
+              f"{'deadline hit' if deadline_hit else 'finished'}")
+        _report_split_params(generator, stats)
+        return GenerationResult(layouts, stats, deadline_hit)
+
+    if cache is not None:
+        key = cache_key(cache, rooms, plot_width, plot_height, max_layouts, max_attempts, seed,
+                        min_rooms, packer, min_distance, adaptive, engine)
+        layouts = cache.get(key, rooms)
+        if layouts is not None:
+            print(f"Loaded {len(layouts)} layouts from cache")
+            if stats is not None:
+                stats.cache_hits += 1
+                return GenerationResult(layouts, stats)
+            return layouts
+        if stats is not None:
+            stats.cache_misses += 1
+        layouts = generate_layouts(rooms, plot_width, plot_height, max_layouts, max_attempts,
+                                   workers, seed, min_rooms, packer, stats=stats,
+                                   min_distance=min_distance, adaptive=adaptive, engine=engine)
+        cache.put(key, layouts)
+        return layouts
+
+    if engine == 'batch':
+        from batch_engine import generate_layouts_batch
+
+        return generate_layouts_batch(rooms, plot_width, plot_height, max_layouts, max_attempts,
+                                      seed=seed, min_rooms=min_rooms)
+
+    if workers and workers > 1 and not adaptive:
+        return generate_layouts_parallel(rooms, plot_width, plot_height,
+                                         max_layouts, max_attempts, workers, seed=seed,
+                                         min_rooms=min_rooms, packer=packer, stats=stats,
+                                         min_distance=min_distance)
+
+    generator = LayoutGenerator(rooms, plot_width, plot_height, seed=seed,
+                                min_rooms=min_rooms, packer=packer, stats=stats,
+                                min_distance=min_distance, adaptive=adaptive)
+    print(f"Attempting to generate up to {max_layouts} unique layouts...")
+    if stats is None:
+        layouts = generator.next(max_layouts, max_attempts)
+    else:
+        with stats.measure():
+            layouts = GenerationResult(generator.next(max_layouts, max_attempts), stats)
+    print(f"  {generator.attempts} attempts: {generator.pruned} pruned early, "
+          f"{generator.attempts - generator.pruned} completed")
+    _report_split_params(generator, stats)
+    return layouts
+
+
+def cache_key(cache, rooms, plot_width, plot_height, max_layouts, max_attempts, seed,
+              min_rooms=1, packer='greedy', min_distance=None, adaptive=False, engine='scalar'):
+    """``cache`` key of a ``generate_layouts`` search with these arguments"""
+    # Newer options only join the key when set, so existing entries stay valid
+    extra = {} if min_distance is None else {'min_distance': min_distance}
+    if adaptive:
+        from split_bandit import BLOCK
+
+        # The draw block decides which layouts an adaptive run finds
+        extra['adaptive'] = BLOCK
+    if engine != 'scalar':
+        extra['engine'] = engine
+    return cache.make_key(rooms, plot_width, plot_height, max_layouts=max_layouts,
+                          max_attempts=max_attempts, seed=seed, min_rooms=min_rooms,
+                          packer=packer, **extra)
+
+
+def _report_split_params(generator, stats):
+    if generator.bandit is None:
+        return
+    print(f"  {generator.bandit.summary()}")
+    if stats is not None:
+        stats.split_params = generator.bandit.learned()
+
+
+def generate_layouts_parallel(rooms, plot_width, plot_height, max_layouts=10, max_attempts=500,
+                              workers=None, chunk_size=64, seed=0, min_rooms=1, packer='greedy',
+                              stats=None, min_distance=None):
+    """Parallel version of generate_layouts over a process pool.
+
+    Seeds are handed out in chunks of ``chunk_size``; chunk results are merged
+    strictly in seed order so the first ``max_layouts`` unique layouts are the
+    same ones the serial loop would return. ``stats`` counts whole merged
+    chunks, so it can include a few attempts past the last layout kept.
+    """
+    if stats is not None:
+        with stats.measure():
+            layouts = _generate_parallel(rooms, plot_width, plot_height, max_layouts,
+                                         max_attempts, workers, chunk_size, seed, min_rooms,
+                                         packer, stats, min_distance)
+        return GenerationResult(layouts, stats)
+    return _generate_parallel(rooms, plot_width, plot_height, max_layouts, max_attempts,
+                              workers, chunk_size, seed, min_rooms, packer, None, min_distance)
+
+
+def _generate_parallel(rooms, plot_width, plot_height, max_layouts, max_attempts, workers,
+                       chunk_size, seed, min_rooms, packer, stats, min_distance):
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    layouts = []
+    seen_signatures = set()
+    index = None
+    if min_distance:
+        from similarity import SimilarityIndex
+
+        index = SimilarityIndex(plot_width, plot_height, min_distance)
+    starts = iter(range(seed, seed + max_attempts, chunk_size))
+    pending = deque()
+    attempts = 0
+    pruned = 0
+
+    print(f"Attempting to generate up to {max_layouts} unique layouts on {workers} workers...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def submit_next():
+            start = next(starts, None)
+            if start is not None:
+                stop = min(start + chunk_size, seed + max_attempts)
+                future = pool.submit(_search_seed_range, rooms, plot_width, plot_height,
+                                     start, stop, min_rooms, packer, stats is not None)
+                pending.append((future, stop - start))
+
+        # Keep a couple of chunks queued per worker so nobody idles while the
+        # oldest chunk is being merged
+        for _ in range(workers * 2):
+            submit_next()
+
+        while pending and len(layouts) < max_layouts:
+            future, chunk_attempts = pending.popleft()
+            found, chunk_pruned, chunk_stats = future.result()
+            attempts += chunk_attempts
+            pruned += chunk_pruned
+            if stats is not None:
+                stats.merge(chunk_stats)
+            for layout in found:
+                signature = layout.get_signature()
+                if signature in seen_signatures:
+                    if stats is not None:
+                        stats.duplicates += 1
+                    continue
+                seen_signatures.add(signature)
+                if index is not None and not index.admit(layout):
+                    if stats is not None:
+                        stats.near_duplicates += 1
+                    continue
+                layouts.append(layout)
                 if len(layouts) % 10 == 0:
                     print(f"  Generated {len(layouts)} layouts so far...")
+                if len(layouts) >= max_layouts:
+                    break
+            submit_next()
 
-        attempts += 1
+        for future, _ in pending:
+            future.cancel()
 
+    print(f"  {attempts} attempts: {pruned} pruned early, {attempts - pruned} completed")
     return layouts
 
 
+# matplotlib is only imported by the drawing functions below: the search
+# needs nothing but the standard library, and importing matplotlib costs
+# every CLI run and pool worker far more than a typical search
+
+
 def visualize_layouts(layouts, plot_width, plot_height, rooms):
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as patches
+
     num_layouts = len(layouts)
     if num_layouts == 0:
         print("No layouts to visualize!")
@@ -332,6 +1265,9 @@ def draw_layout(ax, layout, plot_width, plot_height, rooms):
     This re-uses the drawing logic from visualize_layouts but targets a single
     axis so it can be embedded in a GUI carousel.
     """
+    import matplotlib.patches as patches
+    from matplotlib import cm
+
     ax.clear()
     ax.set_xlim(0, plot_width)
     ax.set_ylim(0, plot_height)
@@ -356,7 +1292,7 @@ def draw_layout(ax, layout, plot_width, plot_height, rooms):
                                     facecolor='lightgray', alpha=0.7)
         ax.add_patch(rect)
 
-    colors = plt.cm.Set3.colors
+    colors = cm.Set3.colors
     for i, room in enumerate(layout.placed_rooms):
         color = colors[room.id % len(colors)]
         rect = patches.Rectangle((room.x, room.y), room.placed_width,
@@ -380,6 +1316,38 @@ def draw_layout(ax, layout, plot_width, plot_height, rooms):
 
 if __name__ == '__main__':
     # Demo / CLI execution
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Floor plan layout generator demo")
+    parser.add_argument('--renderer', choices=['matplotlib', 'svg', 'png'], default='matplotlib',
+                        help="matplotlib: one combined figure (default); svg/png: one file per "
+                             "layout written without matplotlib")
+    parser.add_argument('--stats', action='store_true',
+                        help="print per-stage timings, rejection reasons and duplicate rate")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="run the search under cProfile and write the profile to FILE "
+                             "(implies --stats)")
+    parser.add_argument('--optimize', type=float, metavar='SECONDS',
+                        help="improve the layouts by simulated annealing for SECONDS")
+    parser.add_argument('--objective', choices=['rooms', 'area', 'compact'], default='rooms',
+                        help="what --optimize maximizes (default: rooms placed)")
+    parser.add_argument('--min-distance', type=float, metavar='FRACTION',
+                        help="skip layouts differing from an earlier one in less than FRACTION "
+                             "of the plot (e.g. 0.1)")
+    parser.add_argument('--deadline-ms', type=int, metavar='MS',
+                        help="search for MS milliseconds and keep the best layouts found, "
+                             "instead of stopping after 500 attempts")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="tune the corridor split parameters during the run from the "
+                             "attempts that yield new layouts")
+    parser.add_argument('--engine', choices=ENGINES, default='scalar',
+                        help="batch: evaluate candidates thousands at a time with NumPy "
+                             "(greedy packer only; other layouts than the scalar search)")
+    parser.add_argument('--export', metavar='PATH',
+                        help="also write the layouts in columnar form to PATH: a .npz file or "
+                             "a directory of memory-mappable .npy files (see layout_export)")
+    args = parser.parse_args()
+
     rooms = [
         Room(1, 10, 12),
         Room(2, 15, 8),
@@ -404,7 +1372,31 @@ if __name__ == '__main__':
     print("=" * 60)
 
 
-    layouts = generate_layouts(rooms, plot_width, plot_height, max_layouts=20, max_attempts=500)
+    from layout_cache import default_cache
+
+    stats = None
+    if args.stats or args.profile:
+        import cProfile
+
+        stats = GenerationStats(profiler=cProfile.Profile() if args.profile else None,
+                                trace_memory=True)
+
+    if args.optimize:
+        from optimize import optimize_layouts
+
+        layouts = optimize_layouts(rooms, plot_width, plot_height, max_layouts=20,
+                                   time_budget=args.optimize, objective=args.objective)
+    else:
+        layouts = generate_layouts(rooms, plot_width, plot_height, max_layouts=20,
+                                   max_attempts=500, cache=default_cache(), stats=stats,
+                                   min_distance=args.min_distance, deadline_ms=args.deadline_ms,
+                                   adaptive=args.adaptive, engine=args.engine)
+
+    if stats is not None:
+        print(stats.summary())
+        if args.profile:
+            stats.profiler.dump_stats(args.profile)
+            print(f"Saved profile to '{args.profile}'")
 
     print("=" * 60)
     print(f"SUCCESSFULLY GENERATED {len(layouts)} UNIQUE LAYOUTS!")
@@ -417,7 +1409,26 @@ if __name__ == '__main__':
                   f"Area: {layout.get_room_area():4d}/{plot_width*plot_height}, "
                   f"Corridors: {len(layout.corridors):2d}")
 
-        print(f"\nVisualizing all {len(layouts)} layouts...")
-        visualize_layouts(layouts, plot_width, plot_height, rooms)
+        if args.export:
+            from layout_export import export_layouts
+
+            export_layouts(layouts, args.export, plot_width, plot_height)
+            print(f"\nExported {len(layouts)} layouts to '{args.export}'")
+
+        if args.renderer == 'matplotlib':
+            print(f"\nVisualizing all {len(layouts)} layouts...")
+            visualize_layouts(layouts, plot_width, plot_height, rooms)
+        else:
+            from fast_render import layout_to_png, layout_to_svg
+
+            for i, layout in enumerate(layouts):
+                filename = f'floor_plan_layout_{i+1:02d}.{args.renderer}'
+                if args.renderer == 'svg':
+                    with open(filename, 'w') as f:
+                        f.write(layout_to_svg(layout, plot_width, plot_height))
+                else:
+                    with open(filename, 'wb') as f:
+                        f.write(layout_to_png(layout, plot_width, plot_height))
+            print(f"\nSaved {len(layouts)} layouts to 'floor_plan_layout_NN.{args.renderer}'")
     else:
         print("No valid layouts generated!")
\ No newline at end of file
@@ -0,0 +1,265 @@
+"""Vectorized NumPy engine that evaluates whole batches of candidate layouts.
+
+The object-based pipeline in ``allocate`` builds every candidate from
+``Corridor`` and ``Room`` objects. Here N candidates are held as arrays:
+
+* zone rectangles ``(N, Z)`` produced by a breadth-first corridor split,
+* corridors ``(N, Z - 1)`` indexed by split-tree node,
+* placed coordinates / orientation flags ``(N, R)`` per room.
+
+The shelf placement of ``place_rooms`` and the area check run for the whole
+batch in lock-step; only the accepted candidates are turned back into
+``Layout`` objects. The split and packing heuristics are the same as in
+``allocate`` but the random stream is NumPy's, so a given seed yields
+different (still reproducible) layouts than ``generate_layouts``. One room
+order is drawn per candidate and reused for every zone.
+
+``allocate.generate_layouts(..., engine='batch')`` runs this engine; see
+``bench.py``'s ``batch`` benchmark for its candidates per second.
+"""
+from array import array
+
+import numpy as np
+
+from allocate import CORRIDOR_WIDTH, Corridor, CorridorType, Layout, room_specs
+
+MAX_DEPTH = 5
+MAX_ZONES = 2 ** MAX_DEPTH
+
+
+def split_batch(n, plot_width, plot_height, min_zone_dim, rng):
+    """Breadth-first corridor split of ``n`` plots.
+
+    Node ``s`` at depth ``d`` keeps its first child in slot ``s`` and puts the
+    second child in slot ``s + 2**d``; its corridor is stored at index
+    ``2**d - 1 + s``. Returns ``(zones, zone_alive, corridors, corridor_alive)``
+    where ``zones`` is ``(n, MAX_ZONES, 4)`` of x, y, w, h and ``corridors`` is
+    ``(n, MAX_ZONES - 1, 4)`` of pos, type, start, end.
+    """
+    zones = np.zeros((n, MAX_ZONES, 4), dtype=np.int64)
+    zones[:, 0] = (0, 0, plot_width, plot_height)
+    zone_alive = np.zeros((n, MAX_ZONES), dtype=bool)
+    zone_alive[:, 0] = True
+    is_open = zone_alive.copy()
+    corridors = np.zeros((n, MAX_ZONES - 1, 4), dtype=np.int64)
+    corridor_alive = np.zeros((n, MAX_ZONES - 1), dtype=bool)
+
+    max_depth = rng.integers(3, 6, size=n)
+
+    for depth in range(MAX_DEPTH):
+        width = 2 ** depth
+        x, y, w, h = (zones[:, :width, i] for i in range(4))
+
+        can_h = h > 2 * min_zone_dim + CORRIDOR_WIDTH
+        can_v = w > 2 * min_zone_dim + CORRIDOR_WIDTH
+        active = is_open[:, :width] & (depth < max_depth)[:, None] & (can_h | can_v)
+        active &= rng.random((n, width)) <= 0.8 - depth * 0.15
+
+        bias = 0.6 if depth % 2 == 0 else 0.4
+        horizontal = np.where(can_h & can_v, rng.random((n, width)) < bias, can_h)
+
+        length = np.where(horizontal, h, w)
+        max_pos = length - CORRIDOR_WIDTH - min_zone_dim
+        active &= max_pos > min_zone_dim
+        span = np.maximum(max_pos - min_zone_dim + 1, 1)
+        split = min_zone_dim + (rng.random((n, width)) * span).astype(np.int64)
+
+        first = np.stack([x, y, np.where(horizontal, w, split), np.where(horizontal, split, h)], axis=-1)
+        second = np.stack([
+            np.where(horizontal, x, x + split + CORRIDOR_WIDTH),
+            np.where(horizontal, y + split + CORRIDOR_WIDTH, y),
+            np.where(horizontal, w, w - split - CORRIDOR_WIDTH),
+            np.where(horizontal, h - split - CORRIDOR_WIDTH, h),
+        ], axis=-1)
+        corridor = np.stack([
+            np.where(horizontal, y + split, x + split),
+            np.where(horizontal, CorridorType.HORIZONTAL.value, CorridorType.VERTICAL.value),
+            np.where(horizontal, x, y),
+            np.where(horizontal, x + w, y + h),
+        ], axis=-1)
+
+        mask = active[..., None]
+        zones[:, :width] = np.where(mask, first, zones[:, :width])
+        zones[:, width:2 * width] = np.where(mask, second, zones[:, width:2 * width])
+        zone_alive[:, width:2 * width] = active
+        is_open[:, :width] = active
+        is_open[:, width:2 * width] = active
+        corridors[:, width - 1:2 * width - 1] = np.where(mask, corridor, 0)
+        corridor_alive[:, width - 1:2 * width - 1] = active
+
+    return zones, zone_alive, corridors, corridor_alive
+
+
+def pack_batch(zones, zone_alive, room_w, room_h, rng):
+    """Shelf-pack the rooms of every candidate into its zones.
+
+    Mirrors ``place_rooms``: zones are visited in random order, rows are
+    filled left to right by scanning the remaining rooms in the candidate's
+    room order, and each room tries a randomly preferred orientation first.
+    Returns ``(placed, x, y, rotated, step)``, all ``(n, R)``; ``step`` is the
+    placement order.
+    """
+    n = zones.shape[0]
+    n_rooms = len(room_w)
+    rows = np.arange(n)
+
+    # Per-room state is kept transposed and in room-order space, (R, n), so
+    # the scan over order positions touches contiguous rows
+    placed = np.zeros((n_rooms, n), dtype=bool)
+    px = np.zeros((n_rooms, n), dtype=np.int64)
+    py = np.zeros((n_rooms, n), dtype=np.int64)
+    rotated = np.zeros((n_rooms, n), dtype=bool)
+    step = np.full((n_rooms, n), n_rooms, dtype=np.int64)
+    placed_count = np.zeros(n, dtype=np.int64)
+
+    zone_order = np.argsort(np.where(zone_alive, rng.random(zone_alive.shape), 2.0), axis=1)
+    room_order = np.argsort(rng.random((n, n_rooms)), axis=1)
+    order_w = room_w[room_order].T
+    order_h = room_h[room_order].T
+    zone_count = zone_alive.sum(axis=1)
+
+    for k in range(int(zone_count.max())):
+        zx, zy, zw, zh = (zones[rows, zone_order[:, k], i] for i in range(4))
+        packing = (k < zone_count) & (placed_count < n_rooms)
+        flips = rng.random((n_rooms, n)) < 0.5
+        curr_y = zy.copy()
+
+        while True:
+            # Work only on the candidates still filling rows in this zone
+            act = np.flatnonzero(packing)
+            if not act.size:
+                break
+            x_end = zx[act] + zw[act]
+            y_end = zy[act] + zh[act]
+            cy = curr_y[act]
+            cx = zx[act].copy()
+            count = placed_count[act]
+            row_ht = np.zeros(act.size, dtype=np.int64)
+            placed_in_row = np.zeros(act.size, dtype=bool)
+            sub_placed, sub_x, sub_y = placed[:, act], px[:, act], py[:, act]
+            sub_rot, sub_step = rotated[:, act], step[:, act]
+
+            for j in range(n_rooms):
+                free = ~sub_placed[j]
+                flip = flips[j, act]
+                w, h = order_w[j, act], order_h[j, act]
+                w1, h1 = np.where(flip, h, w), np.where(flip, w, h)
+
+                fit1 = free & (cx + w1 <= x_end) & (cy + h1 <= y_end)
+                fit2 = free & ~fit1 & (cx + h1 <= x_end) & (cy + w1 <= y_end)
+                fit = fit1 | fit2
+                if not fit.any():
+                    continue
+
+                sub_placed[j] |= fit
+                sub_x[j] = np.where(fit, cx, sub_x[j])
+                sub_y[j] = np.where(fit, cy, sub_y[j])
+                sub_rot[j] = np.where(fit, np.where(fit1, flip, ~flip), sub_rot[j])
+                sub_step[j] = np.where(fit, count, sub_step[j])
+                count = count + fit
+                cx = np.where(fit1, cx + w1, np.where(fit2, cx + h1, cx))
+                row_ht = np.where(fit1, np.maximum(row_ht, h1),
+                                  np.where(fit2, np.maximum(row_ht, w1), row_ht))
+                placed_in_row |= fit
+
+            placed[:, act], px[:, act], py[:, act] = sub_placed, sub_x, sub_y
+            rotated[:, act], step[:, act] = sub_rot, sub_step
+            placed_count[act] = count
+            curr_y[act] = cy + row_ht
+            packing[act] = placed_in_row & (curr_y[act] < y_end) & (count < n_rooms)
+
+    # Back from room-order space to room indices
+    inverse = np.argsort(room_order, axis=1)
+    return tuple(np.take_along_axis(a.T, inverse, axis=1) for a in (placed, px, py, rotated, step))
+
+
+def evaluate_batch(rooms, plot_width, plot_height, n, rng, min_rooms=1):
+    """Split, pack and check ``n`` candidates. Returns a dict of arrays plus
+    the boolean ``accepted`` mask."""
+    room_w = np.array([r.width for r in rooms], dtype=np.int64)
+    room_h = np.array([r.height for r in rooms], dtype=np.int64)
+    min_zone_dim = int(np.minimum(room_w, room_h).min())
+
+    zones, zone_alive, corridors, corridor_alive = split_batch(
+        n, plot_width, plot_height, min_zone_dim, rng
+    )
+    placed, px, py, rotated, step = pack_batch(zones, zone_alive, room_w, room_h, rng)
+
+    area = (placed * (room_w * room_h)).sum(axis=1)
+    accepted = ((placed.sum(axis=1) >= max(min_rooms, 1)) &
+                (area <= plot_width * plot_height * 0.7))
+
+    return {
+        "corridors": corridors, "corridor_alive": corridor_alive,
+        "placed": placed, "x": px, "y": py, "rotated": rotated, "step": step,
+        "accepted": accepted,
+    }
+
+
+def batch_signatures(batch):
+    """One int64 row per candidate that is equal for two candidates exactly
+    when their ``Layout.get_signature()`` would be (given distinct room ids)"""
+    room_part = np.where(
+        batch["placed"],
+        ((batch["x"] // 5) * 2 ** 20 + (batch["y"] // 5) * 2) + batch["rotated"],
+        -1,
+    )
+    corridors = batch["corridors"]
+    corridor_part = np.sort(np.where(
+        batch["corridor_alive"],
+        (corridors[..., 0] // 5) * 4 + corridors[..., 1],
+        -1,
+    ), axis=1)
+    return np.concatenate([room_part, corridor_part], axis=1)
+
+
+def to_layout(batch, i, specs):
+    """Convert candidate ``i`` of an evaluated batch into a ``Layout`` over ``specs``"""
+    corridors = [
+        Corridor(int(pos), CorridorType(int(kind)), int(start), int(end))
+        for (pos, kind, start, end) in batch["corridors"][i][batch["corridor_alive"][i]]
+    ]
+    placed = np.flatnonzero(batch["placed"][i])
+    placed = placed[np.argsort(batch["step"][i, placed])]
+    placements = np.stack([
+        placed, batch["x"][i, placed], batch["y"][i, placed], batch["rotated"][i, placed]
+    ], axis=1).astype(np.int32)
+    return Layout.from_placements(corridors, specs, array('i', placements.tobytes()))
+
+
+def generate_layouts_batch(rooms, plot_width, plot_height, max_layouts=10, max_attempts=10000,
+                           batch_size=4096, seed=0, min_rooms=1):
+    """Batched counterpart of ``allocate.generate_layouts``, which calls it
+    for ``engine='batch'``.
+
+    Candidates are evaluated ``batch_size`` at a time; batch ``b`` draws from
+    ``np.random.default_rng((seed, b))`` so results are reproducible from
+    ``(seed, batch_size, inputs)``.
+    """
+    layouts = []
+    seen_signatures = set()
+    attempts = 0
+    batch_index = 0
+    specs = room_specs(rooms)
+
+    print(f"Attempting to generate up to {max_layouts} unique layouts in batches of {batch_size}...")
+    while len(layouts) < max_layouts and attempts < max_attempts:
+        n = min(batch_size, max_attempts - attempts)
+        rng = np.random.default_rng((seed, batch_index))
+        batch = evaluate_batch(rooms, plot_width, plot_height, n, rng, min_rooms)
+
+        # Dedupe on the array signatures so only new winners become objects
+        signatures = batch_signatures(batch)
+        for i in np.flatnonzero(batch["accepted"]):
+            signature = signatures[i].tobytes()
+            if signature not in seen_signatures:
+                layouts.append(to_layout(batch, i, specs))
+                seen_signatures.add(signature)
+                if len(layouts) >= max_layouts:
+                    break
+
+        attempts += n
+        batch_index += 1
+        print(f"  {attempts} candidates evaluated, {len(layouts)} unique layouts")
+
+    return layouts
@@ -0,0 +1,520 @@
+"""Benchmarks for the generator and the web hot paths.
+
+Fixed scenarios and seeds, so two runs on the same machine are comparable:
+
+    python bench.py run -o before.json
+    ... change something ...
+    python bench.py run -o after.json
+    python bench.py compare before.json after.json
+
+``run --quick`` cuts the attempt counts for a fast smoke check and
+``--only`` picks scenarios or benchmarks by name. Each metric is tagged with
+the direction that counts as better, which ``compare`` uses to flag
+regressions beyond ``--threshold``.
+
+``python bench.py startup`` checks module import times in fresh interpreters
+against ``STARTUP_BUDGET_MS`` and exits 1 when one is over budget or pulls in
+a package it must not.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from allocate import (Room, generate_layouts, place_rooms, recursively_split_zone,
+                      try_layout_with_corridors)
+from fast_render import layout_to_png
+
+# name -> (plot width, plot height, room count, room side range)
+SCENARIOS = {
+    'demo': (20, 20, 5, None),
+    'medium': (100, 80, 30, (4, 16)),
+    'large': (400, 300, 200, (6, 30)),
+}
+
+# Attempts per scenario for the full and --quick runs
+ATTEMPTS = {'demo': (2000, 200), 'medium': (1000, 100), 'large': (200, 20)}
+
+# Far more rooms than the plot holds, so every zone is offered many rooms it
+# cannot take; only used to compare the packers
+CROWDED = (400, 300, 1000, (4, 12))
+
+# Rooms totalling more than the 70% area cap, with min_rooms close to the
+# most that fit: about a third of attempts yield a layout. Plot, room count,
+# room side range, min_rooms; only used for fixed vs adaptive splits
+HARD = (60, 50, 24, (6, 14), 18)
+
+HIGHER, LOWER = 'higher', 'lower'
+
+# module -> (import budget in ms, packages it must not import)
+STARTUP_BUDGET_MS = {
+    'allocate': (100, ('matplotlib', 'numpy')),
+    'gui_flask': (600, ('matplotlib', 'numpy')),
+    'sweep': (100, ('matplotlib', 'numpy')),
+}
+
+
+def scenario_rooms(name):
+    width, height, count, sides = SCENARIOS[name]
+    if sides is None:
+        # The CLI demo's rooms
+        return [Room(1, 10, 12), Room(2, 15, 8), Room(3, 7, 14), Room(4, 20, 10), Room(5, 12, 12)]
+    rng = random.Random(name)
+    return [Room(i + 1, rng.randint(*sides), rng.randint(*sides)) for i in range(count)]
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def best_of(runs, fn, *args, **kwargs):
+    """``timed`` repeated ``runs`` times, keeping the fastest run to damp noise"""
+    return min((timed(fn, *args, **kwargs) for _ in range(runs)), key=lambda r: r[1])
+
+
+def quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def measure_import(module, runs=5):
+    """Fastest import of ``module`` in a fresh interpreter, in ms, and the
+    heavy optional packages that import loaded"""
+    code = (f"import sys, time; start = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - start); "
+            f"print(' '.join(m for m in ('matplotlib', 'numpy', 'flask') if m in sys.modules))")
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', code], cwd=here, capture_output=True,
+                             text=True, check=True).stdout.splitlines()
+        best = min(best or float('inf'), float(out[0]) * 1000)
+    return best, out[1].split() if len(out) > 1 else []
+
+
+def bench_startup(runs):
+    results = {}
+    for module in STARTUP_BUDGET_MS:
+        elapsed, loaded = measure_import(module, runs)
+        results[f'import_{module}_ms'] = (elapsed, LOWER)
+        results[f'import_{module}_heavy_packages'] = (
+            len([m for m in loaded if m in STARTUP_BUDGET_MS[module][1]]), LOWER)
+    return results
+
+
+def check_startup(runs=5):
+    """Print each module's import time against its budget; returns the failures"""
+    failures = []
+    for module, (budget, forbidden) in STARTUP_BUDGET_MS.items():
+        elapsed, loaded = measure_import(module, runs)
+        pulled = [m for m in loaded if m in forbidden]
+        ok = elapsed <= budget and not pulled
+        print(f"{module:12s} {elapsed:8.1f} ms (budget {budget} ms)"
+              f"{'  imports ' + ', '.join(pulled) if pulled else ''}{'' if ok else '  FAIL'}")
+        if not ok:
+            failures.append(module)
+    return failures
+
+
+def bench_search(name, attempts):
+    """Raw attempt loop: throughput, acceptance and uniqueness over seeds 0..attempts-1"""
+    rooms = scenario_rooms(name)
+    width, height = SCENARIOS[name][:2]
+
+    def search(count):
+        accepted = []
+        for seed in range(count):
+            layout = try_layout_with_corridors(rooms, width, height, seed=seed)
+            if layout:
+                accepted.append(layout)
+        return accepted
+
+    accepted, elapsed = best_of(3, search, attempts)
+    unique = len({layout.get_signature() for layout in accepted})
+
+    # tracemalloc slows allocation down a lot, so peak memory gets its own,
+    # shorter run
+    tracemalloc.start()
+    search(min(attempts, 200))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'attempts_per_sec': (attempts / elapsed, HIGHER),
+        'unique_layouts_per_sec': (unique / elapsed, HIGHER),
+        'acceptance_rate': (len(accepted) / attempts, None),
+        'unique_layouts': (unique, None),
+        'peak_memory_kb': (peak / 1024, LOWER),
+    }
+
+
+def bench_generate(name, attempts):
+    """End-to-end ``generate_layouts`` as the CLI and web app call it, with
+    ``max_layouts`` high enough that the whole attempt budget is spent"""
+    rooms = scenario_rooms(name)
+    width, height = SCENARIOS[name][:2]
+    layouts, elapsed = best_of(3, quiet, generate_layouts, rooms, width, height,
+                               max_layouts=attempts, max_attempts=attempts)
+    return {
+        'generate_sec': (elapsed, LOWER),
+        'layouts': (len(layouts), None),
+    }
+
+
+def bench_diverse(name, attempts):
+    """``generate_layouts`` with a ``min_distance``: the cost of the
+    similarity index and how many layouts survive it"""
+    rooms = scenario_rooms(name)
+    width, height = SCENARIOS[name][:2]
+    layouts, elapsed = best_of(3, quiet, generate_layouts, rooms, width, height,
+                               max_layouts=attempts, max_attempts=attempts, min_distance=0.1)
+    return {
+        'generate_sec': (elapsed, LOWER),
+        'layouts': (len(layouts), None),
+    }
+
+
+def bench_exact(name, attempts):
+    """The attempt loop with the 'exact' packer, starting from an empty shelf cache"""
+    import allocate
+
+    rooms = scenario_rooms(name)
+    width, height = SCENARIOS[name][:2]
+    allocate.SHELF_CACHE.clear()
+    _, elapsed = timed(lambda: [try_layout_with_corridors(rooms, width, height, seed=seed,
+                                                          packer='exact')
+                                for seed in range(attempts)])
+    return {
+        'attempts_per_sec': (attempts / elapsed, HIGHER),
+        'shelf_cache_hit_rate': (allocate.SHELF_CACHE.hit_rate(), HIGHER),
+        'shelf_cache_entries': (len(allocate.SHELF_CACHE), None),
+    }
+
+
+def bench_place_rooms(name, repeat):
+    rooms = scenario_rooms(name)
+    width, height = SCENARIOS[name][:2]
+    rng = random.Random(0)
+    _, elapsed = best_of(3, lambda: [place_rooms(rooms, 0, 0, width, height, rng=rng)
+                                     for _ in range(repeat)])
+    return {'place_rooms_us': (elapsed / repeat * 1e6, LOWER)}
+
+
+def bench_packers(attempts):
+    """The attempt loop with the 'greedy' and 'indexed' packers on CROWDED"""
+    width, height, count, sides = CROWDED
+    rng = random.Random('crowded')
+    rooms = [Room(i + 1, rng.randint(*sides), rng.randint(*sides)) for i in range(count)]
+    results = {}
+    for packer in ('greedy', 'indexed'):
+        _, elapsed = best_of(3, lambda p=packer: [try_layout_with_corridors(rooms, width, height,
+                                                                            seed=seed, packer=p)
+                                                  for seed in range(attempts)])
+        results[f'{packer}_attempts_per_sec'] = (attempts / elapsed, HIGHER)
+    return results
+
+
+# Candidates per second the batch engine is meant to reach
+BATCH_TARGET = 100000
+
+
+def bench_batch(name, attempts):
+    """``engine='batch'``: raw candidates per second of ``evaluate_batch`` at
+    the default batch size, against the scalar attempt loop and
+    ``BATCH_TARGET``, plus end-to-end unique layouts per second"""
+    import numpy as np
+
+    from batch_engine import evaluate_batch
+
+    rooms = scenario_rooms(name)
+    width, height = SCENARIOS[name][:2]
+    candidates = 4096
+    _, elapsed = best_of(3, evaluate_batch, rooms, width, height, candidates,
+                         np.random.default_rng(0))
+    _, scalar = best_of(3, lambda: [try_layout_with_corridors(rooms, width, height, seed=seed)
+                                    for seed in range(attempts)])
+    per_sec = candidates / elapsed
+    total = 4 * candidates
+    layouts, generated = best_of(3, quiet, generate_layouts, rooms, width, height,
+                                 max_layouts=total, max_attempts=total, engine='batch')
+    return {
+        'candidates_per_sec': (per_sec, HIGHER),
+        'speedup_vs_scalar': (per_sec / (attempts / scalar), HIGHER),
+        'target_fraction': (per_sec / BATCH_TARGET, HIGHER),
+        'unique_layouts_per_sec': (len(layouts) / generated, HIGHER),
+    }
+
+
+def bench_adaptive(name, attempts):
+    """Unique layouts per second with fixed and bandit-tuned (``adaptive``)
+    split parameters over the same seeds, so the gain is net of the bandit's
+    own cost"""
+    if name == 'hard':
+        width, height, count, sides, min_rooms = HARD
+        rng = random.Random('hard')
+        rooms = [Room(i + 1, rng.randint(*sides), rng.randint(*sides)) for i in range(count)]
+    else:
+        rooms, min_rooms = scenario_rooms(name), 1
+        width, height = SCENARIOS[name][:2]
+    results = {}
+    for adaptive in (False, True):
+        layouts, elapsed = best_of(3, quiet, generate_layouts, rooms, width, height,
+                                   max_layouts=attempts, max_attempts=attempts,
+                                   min_rooms=min_rooms, adaptive=adaptive)
+        label = 'adaptive' if adaptive else 'fixed'
+        results[f'{label}_unique_per_sec'] = (len(layouts) / elapsed, HIGHER)
+    results['adaptive_gain'] = (results['adaptive_unique_per_sec'][0] /
+                                results['fixed_unique_per_sec'][0], HIGHER)
+    return results
+
+
+def bench_split(name, repeat):
+    rooms = scenario_rooms(name)
+    width, height = SCENARIOS[name][:2]
+    min_zone_dim = min(min(r.width, r.height) for r in rooms)
+    rng = random.Random(0)
+    _, elapsed = best_of(3, lambda: [recursively_split_zone(0, 0, width, height, min_zone_dim, rng,
+                                                            max_depth=rng.randint(3, 5))
+                                     for _ in range(repeat)])
+    return {'split_zone_us': (elapsed / repeat * 1e6, LOWER)}
+
+
+def bench_render(name, count):
+    """Per-image PNG latency for the matplotlib and raster renderers"""
+    from gui_flask import render_png
+
+    rooms = scenario_rooms(name)
+    width, height = SCENARIOS[name][:2]
+    layouts = quiet(generate_layouts, rooms, width, height, max_layouts=count, max_attempts=count * 50)
+    if not layouts:
+        return {}
+    matplotlib_ms = [timed(render_png, layout, width, height, rooms, 6, 100)[1] * 1000
+                     for layout in layouts]
+    raster_ms = [timed(layout_to_png, layout, width, height, 600)[1] * 1000 for layout in layouts]
+    return {
+        'render_matplotlib_p50_ms': (percentile(matplotlib_ms, 0.5), LOWER),
+        'render_matplotlib_p95_ms': (percentile(matplotlib_ms, 0.95), LOWER),
+        'render_raster_p50_ms': (percentile(raster_ms, 0.5), LOWER),
+        'render_raster_p95_ms': (percentile(raster_ms, 0.95), LOWER),
+    }
+
+
+def bench_flask(quick):
+    """Test-client load: submit a job, then browse every gallery page and its
+    thumbnail sprite sheet, cold and then warm"""
+    import gui_flask
+    from layout_cache import LayoutCache
+
+    # The app's layout cache path is fixed when layout_cache is first
+    # imported, so hand it an empty cache of its own for every run
+    cache_dir = tempfile.mkdtemp()
+    cache = LayoutCache(os.path.join(cache_dir, 'bench_cache.sqlite'))
+    default_cache = gui_flask.default_cache
+    gui_flask.default_cache = lambda: cache
+    try:
+        return _bench_gallery(gui_flask.app.test_client(), quick)
+    finally:
+        gui_flask.default_cache = default_cache
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def _bench_gallery(client, quick):
+    rooms = scenario_rooms('demo')
+    max_layouts = 10 if quick else 30
+    form = {'plot_w': '40', 'plot_h': '40', 'max_layouts': str(max_layouts), 'seed': '0',
+            'room_w': [str(r.width) for r in rooms], 'room_h': [str(r.height) for r in rooms]}
+
+    start = time.perf_counter()
+    response = quiet(client.post, '/generate', data=form, headers={'Accept': 'application/json'})
+    job_id = response.get_json()['id']
+    while True:
+        status = client.get(f'/jobs/{job_id}/status').get_json()
+        if status['status'] in ('done', 'cancelled', 'failed'):
+            break
+        time.sleep(0.01)
+    generate_sec = time.perf_counter() - start
+
+    pages = (status['layouts'] + 9) // 10
+    results = {'flask_generate_sec': (generate_sec, LOWER)}
+    for phase in ('cold', 'warm'):
+        page_ms, image_ms, page_images_ms = [], [], []
+        for page in range(1, pages + 1):
+            html, elapsed = timed(client.get, f'/gallery/{job_id}?page={page}')
+            page_ms.append(elapsed * 1000)
+            first = len(image_ms)
+            for url in _image_urls(html.get_data(as_text=True)):
+                image_ms.append(timed(client.get, url)[1] * 1000)
+            page_images_ms.append(sum(image_ms[first:]))
+        total = sum(page_ms) + sum(image_ms)
+        results[f'flask_gallery_{phase}_p50_ms'] = (percentile(page_ms, 0.5), LOWER)
+        results[f'flask_thumb_{phase}_p50_ms'] = (percentile(image_ms, 0.5), LOWER)
+        results[f'flask_thumb_{phase}_p95_ms'] = (percentile(image_ms, 0.95), LOWER)
+        results[f'flask_page_images_{phase}_p50_ms'] = (percentile(page_images_ms, 0.5), LOWER)
+        results[f'flask_{phase}_requests_per_sec'] = ((len(page_ms) + len(image_ms)) / total * 1000, HIGHER)
+    return results
+
+
+def bench_optimize(quick):
+    """Best layout from blind restarts vs. simulated annealing in the same
+    time, on the large scenario's rooms squeezed onto a 200x150 plot"""
+    from optimize import OBJECTIVES, optimize_layouts
+
+    rooms = scenario_rooms('large')
+    width, height = 200, 150
+    budget = 1.0 if quick else 5.0
+    score = OBJECTIVES['rooms']
+
+    deadline = time.monotonic() + budget
+    best = 0.0
+    seed = 0
+    while time.monotonic() < deadline:
+        layout = try_layout_with_corridors(rooms, width, height, seed=seed)
+        seed += 1
+        if layout:
+            best = max(best, score(layout, width * height, 0))
+
+    layouts = quiet(optimize_layouts, rooms, width, height, max_layouts=1, time_budget=budget,
+                    starts=3)
+    annealed = score(layouts[0], width * height, 0) if layouts else 0.0
+    return {
+        'restarts_best_score': (best, HIGHER),
+        'annealing_best_score': (annealed, HIGHER),
+    }
+
+
+def _image_urls(html):
+    """Image and sprite sheet URLs a page loads, each once"""
+    urls = []
+    for marker, end in (('src="', '"'), ("url('", "'")):
+        for part in html.split(marker)[1:]:
+            url = part.split(end, 1)[0].replace('&amp;', '&')
+            if url.startswith(('/image/', '/sprite/')) and url not in urls:
+                urls.append(url)
+    return urls
+
+
+def run(quick=False, only=None):
+    index = 1 if quick else 0
+    benches = []
+    for name in SCENARIOS:
+        attempts = ATTEMPTS[name][index]
+        repeat = 20 if quick else 200
+        benches += [
+            (name, 'search', lambda n=name, a=attempts: bench_search(n, a)),
+            (name, 'generate', lambda n=name, a=attempts: bench_generate(n, a)),
+            (name, 'diverse', lambda n=name, a=attempts: bench_diverse(n, a)),
+            (name, 'exact', lambda n=name, a=attempts: bench_exact(n, a)),
+            (name, 'batch', lambda n=name, a=attempts: bench_batch(n, a)),
+            (name, 'place_rooms', lambda n=name, r=repeat: bench_place_rooms(n, r)),
+            (name, 'split', lambda n=name, r=repeat: bench_split(n, r)),
+        ]
+    for name in ('demo', 'medium', 'hard'):
+        count = 3000 if name == 'hard' else ATTEMPTS[name][0]
+        benches.append((name, 'adaptive',
+                        lambda n=name, a=count // 10 if quick else count: bench_adaptive(n, a)))
+    benches.append(('crowded', 'packers', lambda: bench_packers(5 if quick else 30)))
+    benches.append(('medium', 'render', lambda: bench_render('medium', 5 if quick else 20)))
+    benches.append(('large', 'optimize', lambda: bench_optimize(quick)))
+    benches.append(('web', 'flask', lambda: bench_flask(quick)))
+    benches.append(('cli', 'startup', lambda: bench_startup(3 if quick else 10)))
+
+    results = {}
+    for scenario, bench, fn in benches:
+        label = f'{scenario}.{bench}'
+        if only and not any(o in (scenario, bench, label) for o in only):
+            continue
+        print(f"  {label}...", flush=True)
+        for metric, (value, better) in fn().items():
+            results[f'{label}.{metric}'] = {'value': value, 'better': better}
+    return results
+
+
+def metadata(quick):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'cpus': os.cpu_count(),
+        'quick': quick,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(old, new, threshold=0.1):
+    """Print old vs new for every shared metric; returns the regressed metric names"""
+    regressions = []
+    if old['meta'].get('quick') != new['meta'].get('quick'):
+        print("Warning: comparing a --quick run with a full run; counts will differ\n")
+    print(f"{'metric':58s} {'old':>12s} {'new':>12s} {'change':>8s}")
+    for metric in sorted(set(old['results']) & set(new['results'])):
+        a, b = old['results'][metric]['value'], new['results'][metric]['value']
+        better = new['results'][metric]['better']
+        change = (b - a) / a if a else 0.0
+        flag = ''
+        if better and abs(change) > threshold:
+            improved = (change > 0) == (better == HIGHER)
+            flag = '  better' if improved else '  WORSE'
+            if not improved:
+                regressions.append(metric)
+        print(f"{metric:58s} {a:12.4g} {b:12.4g} {change:+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Floor plan generator benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="run the benchmarks")
+    run_parser.add_argument('-o', '--output', help="write results to this JSON file")
+    run_parser.add_argument('--quick', action='store_true', help="fewer attempts, for a smoke check")
+    run_parser.add_argument('--only', nargs='+', help="scenario, benchmark or scenario.benchmark names")
+    compare_parser = commands.add_parser('compare', help="compare two result files")
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help="relative change reported as better/worse (default 0.1)")
+    commands.add_parser('startup', help="check import times against STARTUP_BUDGET_MS")
+    args = parser.parse_args()
+
+    if args.command == 'startup':
+        sys.exit(1 if check_startup() else 0)
+
+    if args.command == 'compare':
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        sys.exit(1 if compare(old, new, args.threshold) else 0)
+
+    print("Running benchmarks...")
+    report = {'meta': metadata(args.quick), 'results': run(args.quick, args.only)}
+    for metric, entry in report['results'].items():
+        print(f"{metric:58s} {entry['value']:12.4g}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to '{args.output}'")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Matplotlib-free renderers for layouts.
+
+A layout is a few dozen axis-aligned rectangles, so it can be written out as
+SVG text directly, or rasterised into a PNG with plain row fills and zlib.
+Both use the same look as ``draw_layout``: Set3 room colours at 60% opacity,
+grey corridors, dark blue room outlines and ``R<id>`` labels with a ``*`` for
+rotated rooms. Axes, ticks and the grid are left out.
+
+``sprite_to_png`` / ``sprite_to_svg`` draw a row of layouts into one image,
+one square tile each, for the gallery's thumbnails.
+"""
+import struct
+import zlib
+
+from allocate import CORRIDOR_WIDTH, CorridorType
+
+# matplotlib's Set3 palette, as used by draw_layout
+SET3_COLORS = ['#8dd3c7', '#ffffb3', '#bebada', '#fb8072', '#80b1d3', '#fdb462',
+               '#b3de69', '#fccde5', '#d9d9d9', '#bc80bd', '#ccebc5', '#ffed6f']
+
+# 3x5 bitmap glyphs for the characters that appear in room labels
+GLYPHS = {
+    'R': ['110', '101', '110', '101', '101'],
+    '*': ['000', '101', '010', '101', '000'],
+    '0': ['111', '101', '101', '101', '111'],
+    '1': ['010', '110', '010', '010', '111'],
+    '2': ['111', '001', '111', '100', '111'],
+    '3': ['111', '001', '111', '001', '111'],
+    '4': ['101', '101', '111', '001', '001'],
+    '5': ['111', '100', '111', '001', '111'],
+    '6': ['111', '100', '111', '101', '111'],
+    '7': ['111', '001', '001', '001', '001'],
+    '8': ['111', '101', '111', '101', '111'],
+    '9': ['111', '101', '111', '001', '111'],
+}
+
+
+def room_label(room):
+    return f"R{room.id}*" if room.rotated else f"R{room.id}"
+
+
+def corridor_rect(corridor):
+    """``(x, y, w, h)`` of a corridor"""
+    if corridor.type == CorridorType.VERTICAL:
+        return corridor.pos, corridor.start, CORRIDOR_WIDTH, corridor.end - corridor.start
+    return corridor.start, corridor.pos, corridor.end - corridor.start, CORRIDOR_WIDTH
+
+
+def _svg_shapes(layout, plot_width, plot_height):
+    font_size = max(plot_width, plot_height) * 0.035
+    parts = [
+        f'<rect x="0" y="0" width="{plot_width}" height="{plot_height}" fill="white" '
+        'stroke="black" stroke-width="2" vector-effect="non-scaling-stroke"/>',
+    ]
+    for corridor in layout.corridors:
+        x, y, w, h = corridor_rect(corridor)
+        parts.append(f'<rect x="{x}" y="{y}" width="{w}" height="{h}" fill="lightgray" '
+                     'fill-opacity="0.7" stroke="gray" vector-effect="non-scaling-stroke"/>')
+    for room in layout.placed_rooms:
+        color = SET3_COLORS[room.id % len(SET3_COLORS)]
+        parts.append(f'<rect x="{room.x}" y="{room.y}" width="{room.placed_width}" '
+                     f'height="{room.placed_height}" fill="{color}" fill-opacity="0.6" '
+                     'stroke="darkblue" stroke-width="2" vector-effect="non-scaling-stroke"/>')
+        parts.append(f'<text x="{room.x + room.placed_width / 2}" y="{room.y + room.placed_height / 2}" '
+                     f'font-size="{font_size:.2f}" font-family="sans-serif" font-weight="bold" '
+                     f'text-anchor="middle" dominant-baseline="central">{room_label(room)}</text>')
+    return parts
+
+
+def layout_to_svg(layout, plot_width, plot_height, size=None):
+    """SVG document for ``layout``; ``size`` (px) fixes the width, otherwise
+    the drawing scales to its container"""
+    dims = f' width="{size}" height="{size * plot_height / plot_width:.0f}"' if size else ''
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="-1 -1 {plot_width + 2} {plot_height + 2}"{dims}>']
+    parts += _svg_shapes(layout, plot_width, plot_height)
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+def sprite_to_svg(layouts, plot_width, plot_height, tile):
+    """One SVG with ``layouts`` side by side in ``tile`` px squares, layout
+    ``k`` at x offset ``k * tile``"""
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{tile * len(layouts)}" height="{tile}">']
+    for k, layout in enumerate(layouts):
+        parts.append(f'<svg x="{k * tile}" y="0" width="{tile}" height="{tile}" '
+                     f'viewBox="-1 -1 {plot_width + 2} {plot_height + 2}">')
+        parts += _svg_shapes(layout, plot_width, plot_height)
+        parts.append('</svg>')
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+def _rgb(hex_color, alpha=1.0):
+    """Colour as RGB bytes, blended onto white with ``alpha``"""
+    channels = (int(hex_color[i:i + 2], 16) for i in (1, 3, 5))
+    return bytes(round(alpha * c + (1 - alpha) * 255) for c in channels)
+
+
+WHITE = _rgb('#ffffff')
+BLACK = _rgb('#000000')
+GRAY = _rgb('#808080')
+DARKBLUE = _rgb('#00008b')
+CORRIDOR_FILL = _rgb('#d3d3d3', 0.7)
+ROOM_FILLS = [_rgb(c, 0.6) for c in SET3_COLORS]
+
+
+class _Canvas:
+    """RGB raster whose rows already carry the PNG filter byte"""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.stride = 1 + 3 * width
+        self.buf = bytearray((b'\x00' + WHITE * width) * height)
+
+    def fill(self, x0, y0, x1, y1, color):
+        x0, x1 = max(x0, 0), min(x1, self.width)
+        y0, y1 = max(y0, 0), min(y1, self.height)
+        if x1 <= x0:
+            return
+        line = color * (x1 - x0)
+        buf, stride, span = self.buf, self.stride, len(line)
+        for start in range(y0 * stride + 1 + 3 * x0, y1 * stride, stride):
+            buf[start:start + span] = line
+
+    def outline(self, x0, y0, x1, y1, color, width=1):
+        self.fill(x0, y0, x1, y0 + width, color)
+        self.fill(x0, y1 - width, x1, y1, color)
+        self.fill(x0, y0, x0 + width, y1, color)
+        self.fill(x1 - width, y0, x1, y1, color)
+
+    def text(self, cx, cy, label, max_width, max_height, color=BLACK):
+        """Centre ``label`` on (cx, cy) at the largest whole glyph scale that fits"""
+        scale = min(max_width // (4 * len(label)), max_height // 6, 3)
+        if scale < 1:
+            return
+        x = cx - (4 * len(label) - 1) * scale // 2
+        y = cy - 5 * scale // 2
+        for char in label:
+            for r, bits in enumerate(GLYPHS[char]):
+                for c, bit in enumerate(bits):
+                    if bit == '1':
+                        px, py = x + c * scale, y + r * scale
+                        self.fill(px, py, px + scale, py + scale, color)
+            x += 4 * scale
+
+    def to_png(self):
+        def chunk(tag, data):
+            return (struct.pack('>I', len(data)) + tag + data +
+                    struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+        header = struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0)
+        return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) +
+                chunk(b'IDAT', zlib.compress(bytes(self.buf), 6)) + chunk(b'IEND', b''))
+
+
+def _draw(canvas, layout, plot_width, plot_height, scale, left=0, top=0):
+    def px(value):
+        return int(round(value * scale))
+
+    for corridor in layout.corridors:
+        x, y, w, h = corridor_rect(corridor)
+        x0, y0, x1, y1 = left + px(x), top + px(y), left + px(x + w), top + px(y + h)
+        canvas.fill(x0, y0, x1, y1, CORRIDOR_FILL)
+        canvas.outline(x0, y0, x1, y1, GRAY)
+    for room in layout.placed_rooms:
+        x0, y0 = left + px(room.x), top + px(room.y)
+        x1, y1 = left + px(room.x + room.placed_width), top + px(room.y + room.placed_height)
+        canvas.fill(x0, y0, x1, y1, ROOM_FILLS[room.id % len(ROOM_FILLS)])
+        canvas.outline(x0, y0, x1, y1, DARKBLUE, 2 if scale >= 4 else 1)
+        canvas.text((x0 + x1) // 2, (y0 + y1) // 2, room_label(room), x1 - x0 - 4, y1 - y0 - 4)
+    canvas.outline(left, top, left + px(plot_width), top + px(plot_height), BLACK, 2)
+
+
+def layout_to_png(layout, plot_width, plot_height, pixels=600):
+    """PNG bytes for ``layout``, ``pixels`` along the longer plot side"""
+    scale = pixels / max(plot_width, plot_height)
+    canvas = _Canvas(int(round(plot_width * scale)), int(round(plot_height * scale)))
+    _draw(canvas, layout, plot_width, plot_height, scale)
+    return canvas.to_png()
+
+
+def sprite_to_png(layouts, plot_width, plot_height, tile, margin=4):
+    """One PNG with ``layouts`` side by side in ``tile`` px squares, layout
+    ``k`` at x offset ``k * tile``, each centred with ``margin`` px around it"""
+    canvas = _Canvas(tile * len(layouts), tile)
+    scale = (tile - 2 * margin) / max(plot_width, plot_height)
+    left = (tile - int(round(plot_width * scale))) // 2
+    top = (tile - int(round(plot_height * scale))) // 2
+    for k, layout in enumerate(layouts):
+        _draw(canvas, layout, plot_width, plot_height, scale, k * tile + left, top)
+    return canvas.to_png()
@@ -0,0 +1,209 @@
+"""Optional instrumentation for the layout search.
+
+Pass a ``GenerationStats`` to ``generate_layouts`` (or ``LayoutGenerator``)
+to collect, per attempt, the time spent splitting the plot into corridors
+and zones, the time spent packing, and why rejected attempts failed. Per
+found layout it records the signature time and whether the layout was a
+duplicate (or, with ``min_distance``, a near-duplicate). With no stats
+object the search takes its uninstrumented path, so disabled
+instrumentation costs nothing.
+
+``profiler`` (e.g. a ``cProfile.Profile``) and ``trace_memory`` hook
+cProfile and tracemalloc around the search.
+"""
+import tracemalloc
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+
+# Attempt outcomes; all but ACCEPTED are rejection reasons
+ACCEPTED = 'accepted'
+INFEASIBLE_SPLIT = 'infeasible_split'
+AREA_EXCEEDED = 'area_exceeded'
+MIN_ROOMS_UNREACHABLE = 'min_rooms_unreachable'
+TOO_FEW_ROOMS = 'too_few_rooms'
+# Abandoned mid-construction once it could only end as a known layout
+DUPLICATE = 'duplicate'
+REJECTION_REASONS = (INFEASIBLE_SPLIT, AREA_EXCEEDED, MIN_ROOMS_UNREACHABLE, TOO_FEW_ROOMS,
+                     DUPLICATE)
+
+# Upper bounds (seconds) of the timing histogram buckets
+BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+           1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, float('inf'))
+
+STAGES = ('split', 'pack', 'signature')
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+
+class GenerationStats:
+    def __init__(self, profiler=None, trace_memory=False):
+        self.profiler = profiler
+        self.trace_memory = trace_memory
+        self.attempts = 0
+        self.outcomes = dict.fromkeys((ACCEPTED,) + REJECTION_REASONS, 0)
+        self.duplicates = 0
+        self.near_duplicates = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.timings = {stage: Histogram() for stage in STAGES}
+        self.wall_time = 0.0
+        self.peak_memory = None
+        # Set by adaptive runs: the split parameters the bandit settled on
+        self.split_params = None
+
+    @property
+    def accepted(self):
+        return self.outcomes[ACCEPTED]
+
+    @property
+    def unique(self):
+        return self.accepted - self.duplicates - self.near_duplicates
+
+    def duplicate_rate(self):
+        return self.duplicates / self.accepted if self.accepted else 0.0
+
+    def record_attempt(self, split_time, pack_time, outcome):
+        self.attempts += 1
+        self.outcomes[outcome] += 1
+        self.timings['split'].observe(split_time)
+        self.timings['pack'].observe(pack_time)
+
+    def signature(self, layout):
+        """``layout.get_signature()``, timed"""
+        start = perf_counter()
+        signature = layout.get_signature()
+        self.timings['signature'].observe(perf_counter() - start)
+        return signature
+
+    def merge(self, other):
+        self.attempts += other.attempts
+        for outcome, count in other.outcomes.items():
+            self.outcomes[outcome] += count
+        self.duplicates += other.duplicates
+        self.near_duplicates += other.near_duplicates
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+        for stage, histogram in other.timings.items():
+            self.timings[stage].merge(histogram)
+        self.wall_time += other.wall_time
+        if other.peak_memory is not None:
+            self.peak_memory = max(self.peak_memory or 0, other.peak_memory)
+
+    def __getstate__(self):
+        # Profilers don't pickle; worker processes send their stats back
+        # without them
+        state = self.__dict__.copy()
+        state['profiler'] = None
+        return state
+
+    @contextmanager
+    def measure(self):
+        """Wall time of the block, run under the profiler and tracemalloc if enabled"""
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+        if self.profiler is not None:
+            self.profiler.enable()
+        start = perf_counter()
+        try:
+            yield self
+        finally:
+            self.wall_time += perf_counter() - start
+            if self.profiler is not None:
+                self.profiler.disable()
+            if self.trace_memory:
+                self.peak_memory = max(self.peak_memory or 0, tracemalloc.get_traced_memory()[1])
+            if tracing:
+                tracemalloc.stop()
+
+    def summary(self):
+        lines = [f"Attempts: {self.attempts} in {self.wall_time:.3f}s, "
+                 f"{self.accepted} accepted, {self.unique} unique, "
+                 f"{self.duplicates} duplicates ({self.duplicate_rate():.1%})"]
+        if self.near_duplicates:
+            lines.append(f"Near-duplicates skipped: {self.near_duplicates}")
+        if self.cache_hits or self.cache_misses:
+            lines.append(f"Cache: {self.cache_hits} hits, {self.cache_misses} misses")
+        rejections = ", ".join(f"{reason} {self.outcomes[reason]}" for reason in REJECTION_REASONS)
+        lines.append(f"Rejections: {rejections}")
+        for stage, histogram in self.timings.items():
+            lines.append(f"  {stage:9s} {histogram.count:7d} calls, {histogram.sum:8.3f}s total, "
+                         f"{histogram.mean() * 1e6:8.1f}us mean")
+        if self.split_params is not None:
+            p = self.split_params
+            lines.append(f"Split parameters: max_depth={p['max_depth']}, "
+                         f"split_base={p['split_base']}, h_bias={p['h_bias']}, "
+                         f"{p['unique_rate']:.1%} new layouts")
+        if self.peak_memory is not None:
+            lines.append(f"Peak traced memory: {self.peak_memory / 1024:.0f} KiB")
+        return "\n".join(lines)
+
+    def to_prometheus(self, prefix='layout_', labels=''):
+        """Counters and histograms in the Prometheus text exposition format.
+
+        ``labels`` (e.g. ``'app="web"'``) is added to every sample.
+        """
+        def sample(name, value, extra=''):
+            label_text = ','.join(part for part in (labels, extra) if part)
+            label_text = '{' + label_text + '}' if label_text else ''
+            return f"{prefix}{name}{label_text} {value}"
+
+        def header(name, kind, help_text):
+            return [f"# HELP {prefix}{name} {help_text}", f"# TYPE {prefix}{name} {kind}"]
+
+        lines = header('attempts_total', 'counter', 'Layout attempts made.')
+        lines.append(sample('attempts_total', self.attempts))
+        lines += header('attempt_outcomes_total', 'counter', 'Attempts by outcome.')
+        for outcome, count in self.outcomes.items():
+            lines.append(sample('attempt_outcomes_total', count, f'outcome="{outcome}"'))
+        lines += header('duplicates_total', 'counter', 'Accepted layouts dropped as duplicates.')
+        lines.append(sample('duplicates_total', self.duplicates))
+        lines += header('near_duplicates_total', 'counter',
+                        'Layouts dropped as closer than min_distance to an earlier one.')
+        lines.append(sample('near_duplicates_total', self.near_duplicates))
+        lines += header('cache_requests_total', 'counter', 'Layout cache lookups by result.')
+        lines.append(sample('cache_requests_total', self.cache_hits, 'result="hit"'))
+        lines.append(sample('cache_requests_total', self.cache_misses, 'result="miss"'))
+        lines += header('stage_seconds', 'histogram', 'Time per search stage.')
+        for stage, histogram in self.timings.items():
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(sample('stage_seconds_bucket', cumulative, f'stage="{stage}",le="{le}"'))
+            lines.append(sample('stage_seconds_sum', histogram.sum, f'stage="{stage}"'))
+            lines.append(sample('stage_seconds_count', histogram.count, f'stage="{stage}"'))
+        return "\n".join(lines) + "\n"
+
+
+class GenerationResult(list):
+    """List of layouts returned by ``generate_layouts`` when stats are
+    requested or a deadline is set; ``deadline_hit`` is None without one"""
+
+    def __init__(self, layouts, stats, deadline_hit=None):
+        super().__init__(layouts)
+        self.stats = stats
+        self.deadline_hit = deadline_hit
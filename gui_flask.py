@@ -1,16 +1,59 @@
-
+import hashlib
 import io
-import uuid
-from flask import Flask, request, redirect, url_for, render_template_string, send_file, abort
-import matplotlib
-
-matplotlib.use('Agg')
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from flask import Flask, Response, request, redirect, url_for, render_template_string, abort, jsonify
 
-from allocate import generate_layouts, draw_layout, Room
-import matplotlib.pyplot as plt
+from allocate import iter_layouts, draw_layout, Room, LayoutGenerator, SHELF_CACHE
+from layout_cache import default_cache
+from fast_render import layout_to_png, layout_to_svg, sprite_to_png, sprite_to_svg
+from session_store import make_session_store
+from jobs import Job, JobQueue, FINISHED
+from generation_stats import GenerationStats
 
 app = Flask(__name__)
-STORAGE = {}
+# 'memory' (default) or 'sqlite:<path>' to share sessions between workers
+SESSIONS = make_session_store(os.environ.get('SESSION_STORE', 'memory'))
+# Layouts added per "Load more" click, one gallery page
+LOAD_MORE_COUNT = 10
+GALLERY_PER_PAGE = 10
+# Side (px) of one gallery thumbnail in the page's sprite sheet
+SPRITE_TILE = 160
+# 'matplotlib' (default), 'raster' (matplotlib-free PNGs) or 'svg'
+RENDERER = os.environ.get('LAYOUT_RENDERER', 'matplotlib')
+
+# Search instrumentation for /metrics; set LAYOUT_METRICS=0 to turn it off
+METRICS = GenerationStats() if os.environ.get('LAYOUT_METRICS', '1') != '0' else None
+METRICS_LOCK = threading.Lock()
+
+def new_stats():
+    return GenerationStats() if METRICS is not None else None
+
+def record_stats(stats):
+    if stats is not None:
+        with METRICS_LOCK:
+            METRICS.merge(stats)
+
+def store_job_result(job):
+    record_stats(job.stats)
+    # Cancelled jobs keep whatever they found before stopping
+    if job.layouts:
+        SESSIONS.put(job.id, {"layouts": job.layouts, "plot_w": job.plot_width, "plot_h": job.plot_height,
+                              "rooms": job.rooms, "seed": job.seed, "max_attempts": job.max_attempts,
+                              "min_distance": job.min_distance, "generator": job.generator})
+
+# Upper bounds on the requested time budget and layout count, so one search
+# cannot hold a worker for long
+MAX_DEADLINE_MS = int(os.environ.get('MAX_DEADLINE_MS', 30000))
+MAX_LAYOUTS = int(os.environ.get('MAX_LAYOUTS', 500))
+
+# Searches running at once, and unfinished jobs allowed per client address
+JOBS = JobQueue(workers=int(os.environ.get('JOB_WORKERS', 2)),
+                max_per_owner=int(os.environ.get('JOBS_PER_CLIENT', 3)),
+                on_finish=store_job_result)
 
 INDEX_HTML = '''
 <!doctype html>
@@ -41,7 +84,10 @@ INDEX_HTML = '''
             <div class="row">
                 <label>Plot width: <input type=number name=plot_w value="20" min=1></label>
                 <label>Plot height: <input type=number name=plot_h value="20" min=1></label>
-                <label>Max layouts: <input type=number name=max_layouts value="10" min=1></label>
+                <label>Max layouts: <input type=number name=max_layouts value="10" min=1 max={{ max_layouts }}></label>
+                <label>Seed: <input type=number name=seed value="0" min=0></label>
+                <label title="Skip layouts differing from an earlier one in less than this fraction of the plot">Min distance: <input type=number name=min_distance value="0" min=0 max=1 step=0.01></label>
+                <label title="Search for this long and keep the best layouts found; empty for a fixed number of attempts">Time budget (ms): <input type=number name=deadline_ms min=1 max={{ max_deadline_ms }} placeholder="none"></label>
             </div>
 
                 <div class="row">
@@ -98,6 +144,7 @@ INDEX_HTML = '''
 
             <div class="row">
                 <button type=submit>Generate Layouts</button>
+                <button type=submit formmethod=get formaction="/live" style="background:#10b981">Stream Layouts</button>
                 <div class="muted" style="margin-left:8px">Tip: larger plots and many rooms may take longer to generate.</div>
             </div>
             <div class="footer">After generation you'll be redirected to a gallery of generated layouts where you can click thumbnails to jump to any layout.</div>
@@ -107,6 +154,74 @@ INDEX_HTML = '''
 </html>
 '''
 
+LIVE_HTML = '''
+<!doctype html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Live Layouts</title>
+    <style>
+        body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial; margin:20px; color:#222; }
+        .container { max-width:1100px; margin:0 auto; }
+        .grid { display:grid; grid-template-columns: repeat(5, 1fr); gap:12px; }
+        .thumb { border:1px solid #e6edf3; border-radius:8px; padding:6px; background:#fff; text-align:center; font-size:13px; color:#334155; }
+        canvas { width:100%; height:auto; border-radius:6px; }
+        .muted { color:#666; font-size:13px; }
+        a.btn { display:inline-block; padding:8px 12px; background:#2563eb; color:#fff; text-decoration:none; border-radius:6px; font-weight:600; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>Live layouts</h1>
+        <p class="muted" id="status">Searching...</p>
+        <div class="grid" id="grid"></div>
+        <p><a class="btn" href="/">Back to generator</a></p>
+    </div>
+    <script>
+        const colors = ['#8dd3c7', '#ffffb3', '#bebada', '#fb8072', '#80b1d3', '#fdb462',
+                        '#b3de69', '#fccde5', '#d9d9d9', '#bc80bd', '#ccebc5', '#ffed6f'];
+        const grid = document.getElementById('grid');
+        const status = document.getElementById('status');
+        const source = new EventSource('/stream' + window.location.search);
+        let count = 0;
+        source.addEventListener('layout', (e) => {
+            const layout = JSON.parse(e.data);
+            const scale = 240 / Math.max(layout.plot_w, layout.plot_h);
+            const canvas = document.createElement('canvas');
+            canvas.width = layout.plot_w * scale;
+            canvas.height = layout.plot_h * scale;
+            const ctx = canvas.getContext('2d');
+            ctx.scale(scale, scale);
+            ctx.fillStyle = '#fff';
+            ctx.fillRect(0, 0, layout.plot_w, layout.plot_h);
+            ctx.fillStyle = '#d3d3d3';
+            for (const c of layout.corridors) {
+                if (c.type === 'VERTICAL') ctx.fillRect(c.pos, c.start, 3, c.end - c.start);
+                else ctx.fillRect(c.start, c.pos, c.end - c.start, 3);
+            }
+            ctx.lineWidth = 1 / scale;
+            for (const r of layout.rooms) {
+                ctx.fillStyle = colors[r.id % colors.length];
+                ctx.fillRect(r.x, r.y, r.w, r.h);
+                ctx.strokeStyle = 'darkblue';
+                ctx.strokeRect(r.x, r.y, r.w, r.h);
+            }
+            const div = document.createElement('div');
+            div.className = 'thumb';
+            div.appendChild(canvas);
+            div.appendChild(document.createTextNode('Layout ' + (++count) + ' | Area: ' + layout.area));
+            grid.appendChild(div);
+            status.textContent = 'Searching... ' + count + ' layouts so far';
+        });
+        source.addEventListener('done', () => {
+            status.textContent = 'Done: ' + count + ' layouts';
+            source.close();
+        });
+    </script>
+</body>
+</html>
+'''
+
 VIEW_HTML = '''
 <!doctype html>
 <html>
@@ -134,7 +249,7 @@ VIEW_HTML = '''
         <h1>Layout {{ idx+1 }} / {{ total }}</h1>
         <div class="top">
             <div class="main-image">
-                <img class="floor" src="{{ url_for('layout_image', lid=lid, index=idx) }}" alt="Layout image">
+                <img class="floor" src="{{ image_url(lid, idx) }}" alt="Layout image">
                 <div class="nav">
                     {% if idx>0 %}
                         <a class="btn" href="{{ url_for('view_layout', lid=lid, idx=idx-1) }}">&lt;&lt; Prev</a>
@@ -144,12 +259,14 @@ VIEW_HTML = '''
                     {% endif %}
                                 <a class="btn secondary" href="/">Back to generator</a>
                                 <a class="btn secondary" href="{{ url_for('gallery', lid=lid) }}" style="margin-left:8px">Open gallery</a>
+                                <a class="btn secondary" href="{{ url_for('export_session', lid=lid) }}" style="margin-left:8px">Download .npz</a>
                 </div>
             </div>
             <div class="meta">
                 <p><strong>Plot:</strong> {{ plot_w }} x {{ plot_h }}</p>
                 <p><strong>Rooms in layout:</strong> {{ rooms_count }}</p>
                 <p><strong>Layout area:</strong> {{ area }}</p>
+                <p><strong>Seed:</strong> {{ seed }}</p>
                 <p class="muted">Use Prev/Next to navigate layouts. Thumbnails are for preview only.</p>
             </div>
         </div>
@@ -172,7 +289,7 @@ GALLERY_HTML = '''
         .container { max-width:1100px; margin:0 auto; }
         .grid { display:grid; grid-template-columns: repeat(5, 1fr); gap:12px; }
         .thumb { border:1px solid #e6edf3; border-radius:8px; padding:6px; background:#fff; text-align:center; }
-        .thumb img { width:100%; height:140px; object-fit:cover; border-radius:6px; }
+        .thumb .sprite { display:block; width:{{ tile }}px; height:{{ tile }}px; margin:0 auto; background-repeat:no-repeat; border-radius:6px; }
         .pager { margin-top:12px; display:flex; gap:8px; align-items:center; }
         a.btn { display:inline-block; padding:8px 12px; background:#2563eb; color:#fff; text-decoration:none; border-radius:6px; font-weight:600; }
         a.info { color:#334155; text-decoration:none; }
@@ -184,7 +301,8 @@ GALLERY_HTML = '''
         <div class="grid">
             {% for item in items %}
                 <div class="thumb">
-                    <a href="{{ url_for('view_layout', lid=lid, idx=item.index) }}"><img src="{{ url_for('layout_image', lid=lid, index=item.index) }}" alt="Layout {{ item.index+1 }}"></a>
+                    <a class="sprite" href="{{ url_for('view_layout', lid=lid, idx=item.index) }}" role="img" aria-label="Layout {{ item.index+1 }}"
+                       style="background-image:url('{{ sprite }}'); background-position:-{{ loop.index0 * tile }}px 0"></a>
                     <div style="margin-top:6px"><a class="info" href="{{ url_for('view_layout', lid=lid, idx=item.index) }}">Layout {{ item.index+1 }}</a></div>
                 </div>
             {% endfor %}
@@ -198,27 +316,99 @@ GALLERY_HTML = '''
             {% if page<pages %}
                 <a class="btn" href="{{ url_for('gallery', lid=lid, page=page+1) }}">Next &gt;&gt;</a>
             {% endif %}
+            <form method=post action="{{ url_for('load_more', lid=lid) }}" style="margin:0">
+                <button class="btn" type=submit style="border:none; cursor:pointer; font-size:inherit">Load more</button>
+            </form>
             <a class="btn secondary" href="{{ url_for('view_layout', lid=lid, idx=0) }}" style="margin-left:12px">Open first layout</a>
             <a class="btn secondary" href="/" style="margin-left:8px">Back to generator</a>
+            <a class="btn secondary" href="{{ url_for('export_session', lid=lid) }}" style="margin-left:8px">Download .npz</a>
         </div>
     </div>
 </body>
 </html>
 '''
 
+JOB_HTML = '''
+<!doctype html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Generating Layouts</title>
+    <style>
+        body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial; margin:20px; color:#222; }
+        .container { max-width:640px; margin:0 auto; }
+        .bar { height:14px; background:#e5e7eb; border-radius:7px; overflow:hidden; margin:12px 0; }
+        .bar div { height:100%; width:0; background:#2563eb; transition:width 0.3s; }
+        .muted { color:#666; font-size:13px; }
+        button, a.btn { display:inline-block; padding:8px 12px; background:#2563eb; color:#fff; text-decoration:none; border:none; border-radius:6px; font-weight:600; cursor:pointer; font-size:inherit; }
+        button.cancel { background:#dc2626; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>Generating layouts</h1>
+        <div class="bar"><div id="bar"></div></div>
+        <p id="status">Queued...</p>
+        <p class="muted" id="detail"></p>
+        <p>
+            <button class="cancel" id="cancel" type="button">Cancel</button>
+            <a class="btn" id="results" href="#" style="display:none">View results</a>
+            <a class="btn" href="/" style="background:#f3f4f6; color:#111">Back to generator</a>
+        </p>
+    </div>
+    <script>
+        const statusUrl = '{{ url_for('job_status', job_id=job_id) }}';
+        const cancelUrl = '{{ url_for('cancel_job', job_id=job_id) }}';
+        const finished = ['done', 'cancelled', 'failed'];
+        document.getElementById('cancel').onclick = () => fetch(cancelUrl, {method: 'POST'});
+
+        function show(job) {
+            const frac = job.status === 'done' ? 1 :
+                job.deadline_ms ? 1000 * job.elapsed / job.deadline_ms :
+                Math.max(job.attempts / job.max_attempts, job.layouts / job.max_layouts);
+            document.getElementById('bar').style.width = (100 * Math.min(frac, 1)) + '%';
+            let text = job.status.charAt(0).toUpperCase() + job.status.slice(1) + ': ' +
+                       job.layouts + ' / ' + job.max_layouts + ' layouts';
+            if (job.eta !== null) text += ', about ' + Math.ceil(job.eta) + ' s left';
+            document.getElementById('status').textContent = text;
+            document.getElementById('detail').textContent = job.error ||
+                (job.deadline_ms ? job.attempts + ' attempts in a ' + job.deadline_ms + ' ms budget' +
+                                   (job.deadline_hit === null ? '' : job.deadline_hit ? ', time ran out' : ', search finished early')
+                                 : job.attempts + ' / ' + job.max_attempts + ' attempts') +
+                ', ' + job.elapsed.toFixed(1) + ' s elapsed';
+        }
+
+        async function poll() {
+            const job = await (await fetch(statusUrl)).json();
+            show(job);
+            if (!finished.includes(job.status)) {
+                setTimeout(poll, 500);
+                return;
+            }
+            document.getElementById('cancel').style.display = 'none';
+            if (job.status === 'done' && job.view_url) {
+                window.location = job.view_url;
+            } else if (job.view_url) {
+                const link = document.getElementById('results');
+                link.href = job.view_url;
+                link.style.display = '';
+            }
+        }
+        poll();
+    </script>
+</body>
+</html>
+'''
+
 @app.route('/', methods=['GET'])
 def index():
-    return render_template_string(INDEX_HTML)
-
-@app.route('/generate', methods=['POST'])
-def generate():
-    plot_w = int(request.form.get('plot_w') or 20)
-    plot_h = int(request.form.get('plot_h') or 20)
-    max_layouts = int(request.form.get('max_layouts') or 10)
+    return render_template_string(INDEX_HTML, max_deadline_ms=MAX_DEADLINE_MS, max_layouts=MAX_LAYOUTS)
 
+def parse_rooms(values):
+    """Rooms from the repeated ``room_w``/``room_h`` fields of a form or query string"""
     rooms = []
-    widths = request.form.getlist('room_w')
-    heights = request.form.getlist('room_h')
+    widths = values.getlist('room_w')
+    heights = values.getlist('room_h')
     # zip shortest length
     for i, (w_raw, h_raw) in enumerate(zip(widths, heights)):
         if not w_raw and not h_raw:
@@ -230,21 +420,119 @@ def generate():
             continue
         rid = i + 1
         rooms.append(Room(rid, w, h))
+    return rooms
+
+def layout_to_dict(layout, plot_w, plot_h):
+    return {
+        "plot_w": plot_w,
+        "plot_h": plot_h,
+        "area": layout.get_room_area(),
+        "rooms": [{"id": r.id, "x": r.x, "y": r.y, "w": r.placed_width, "h": r.placed_height,
+                   "rotated": r.rotated} for r in layout.placed_rooms],
+        "corridors": [{"pos": c.pos, "type": c.type.name, "start": c.start, "end": c.end}
+                      for c in layout.corridors],
+    }
+
+@app.route('/generate', methods=['POST'])
+def generate():
+    """Queue a generation job and redirect to its progress page (or, for
+    JSON clients, answer 202 with the job's status URL)"""
+    try:
+        plot_w = int(request.form.get('plot_w') or 20)
+        plot_h = int(request.form.get('plot_h') or 20)
+        max_layouts = int(request.form.get('max_layouts') or 10)
+        seed = int(request.form.get('seed') or 0)
+        min_distance = float(request.form.get('min_distance') or 0) or None
+        deadline_ms = request.form.get('deadline_ms')
+        deadline_ms = min(max(int(deadline_ms), 1), MAX_DEADLINE_MS) if deadline_ms else None
+    except ValueError:
+        return "Plot size, max layouts, seed, min distance and deadline must be numbers.", 400
+    if not 1 <= max_layouts <= MAX_LAYOUTS:
+        return f"Max layouts must be between 1 and {MAX_LAYOUTS}.", 400
 
+    rooms = parse_rooms(request.form)
     if not rooms:
         return "No valid rooms parsed. Please add at least one room with width and height.", 400
 
-    layouts = generate_layouts(rooms, plot_w, plot_h, max_layouts=max_layouts, max_attempts=max_layouts*50)
+    job = Job(rooms, plot_w, plot_h, max_layouts=max_layouts, max_attempts=max_layouts * 50,
+              seed=seed, owner=request.remote_addr, cache=default_cache(), stats=new_stats(),
+              min_distance=min_distance, deadline_ms=deadline_ms)
+    if not JOBS.submit(job):
+        return "Too many generation jobs in progress. Wait for one to finish or cancel it.", 429
 
-    lid = str(uuid.uuid4())
-    STORAGE[lid] = {"layouts": layouts, "plot_w": plot_w, "plot_h": plot_h, "rooms": rooms}
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(id=job.id, status_url=url_for('job_status', job_id=job.id)), 202
+    return redirect(url_for('job_page', job_id=job.id))
 
-    return redirect(url_for('view_layout', lid=lid, idx=0))
+@app.route('/jobs/<job_id>')
+def job_page(job_id):
+    if JOBS.get(job_id) is None:
+        abort(404)
+    return render_template_string(JOB_HTML, job_id=job_id)
+
+@app.route('/jobs/<job_id>/status')
+def job_status(job_id):
+    job = JOBS.get(job_id)
+    if job is None:
+        abort(404)
+    progress = job.progress()
+    if job.status in FINISHED and job.layouts:
+        progress["view_url"] = url_for('view_layout', lid=job.id, idx=0)
+    return jsonify(progress)
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = JOBS.cancel(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.progress())
+
+@app.route('/live', methods=['GET'])
+def live():
+    return render_template_string(LIVE_HTML)
+
+@app.route('/stream', methods=['GET'])
+def stream():
+    """Server-Sent Events: one ``layout`` event per unique layout, then ``done``"""
+    try:
+        plot_w = int(request.args.get('plot_w') or 20)
+        plot_h = int(request.args.get('plot_h') or 20)
+        max_layouts = int(request.args.get('max_layouts') or 10)
+        seed = int(request.args.get('seed') or 0)
+        time_budget = float(request.args.get('time_budget') or 10)
+    except ValueError:
+        return "Plot size, max layouts, seed and time budget must be numbers.", 400
+    if not 1 <= max_layouts <= MAX_LAYOUTS:
+        return f"Max layouts must be between 1 and {MAX_LAYOUTS}.", 400
+    time_budget = min(max(time_budget, 0.001), MAX_DEADLINE_MS / 1000)
+
+    rooms = parse_rooms(request.args)
+    if not rooms:
+        return "No valid rooms parsed. Please add at least one room with width and height.", 400
+
+    # A stream counts as one of the client's unfinished jobs until it closes
+    owner = request.remote_addr
+    if not JOBS.hold(owner):
+        return "Too many generation jobs in progress. Wait for one to finish or cancel it.", 429
+
+    def events():
+        # When the client goes away the server closes this generator, which
+        # in turn closes iter_layouts and stops the search
+        for layout in iter_layouts(rooms, plot_w, plot_h, max_layouts=max_layouts,
+                                   max_attempts=max_layouts * 50, time_budget=time_budget,
+                                   seed=seed):
+            yield f"event: layout\ndata: {json.dumps(layout_to_dict(layout, plot_w, plot_h))}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    response = Response(events(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(lambda: JOBS.release(owner))
+    return response
 
 @app.route('/view/<lid>')
 def view_layout(lid):
     idx = int(request.args.get('idx', 0))
-    data = STORAGE.get(lid)
+    data = SESSIONS.get(lid)
     if not data:
         abort(404)
     layouts = data['layouts']
@@ -254,56 +542,249 @@ def view_layout(lid):
         abort(404)
     layout = layouts[idx]
     area = layout.get_room_area()
-    return render_template_string(VIEW_HTML, lid=lid, idx=idx, total=len(layouts), plot_w=data['plot_w'], plot_h=data['plot_h'], rooms_count=len(layout.placed_rooms), area=area)
+    return render_template_string(VIEW_HTML, lid=lid, idx=idx, total=len(layouts), plot_w=data['plot_w'], plot_h=data['plot_h'], rooms_count=len(layout.placed_rooms), area=area, seed=data['seed'])
 
 
 @app.route('/gallery/<lid>')
 def gallery(lid):
-    data = STORAGE.get(lid)
+    data = SESSIONS.get(lid)
     if not data:
         abort(404)
     layouts = data['layouts']
     if not layouts:
         return "No layouts generated for this id.", 404
 
-    # Pagination: 10 items per page
-    per_page = 10
-    page = int(request.args.get('page', 1))
-    total = len(layouts)
-    pages = (total + per_page - 1) // per_page
-    if page < 1:
-        page = 1
-    if page > pages:
-        page = pages
-
-    start = (page - 1) * per_page
-    end = min(start + per_page, total)
+    page, pages, start, end = gallery_page(len(layouts), int(request.args.get('page', 1)))
     items = []
     for i in range(start, end):
         items.append({"index": i})
 
-    return render_template_string(GALLERY_HTML, lid=lid, items=items, page=page, pages=pages)
+    # All thumbnails of the page come from one sprite sheet; the layout count
+    # is in the URL so a last page that grew after "Load more" is refetched
+    sprite = url_for('gallery_sprite', lid=lid, page=page, n=end - start)
+    return render_template_string(GALLERY_HTML, lid=lid, items=items, page=page, pages=pages,
+                                  sprite=sprite, tile=SPRITE_TILE)
 
-@app.route('/image/<lid>/<int:index>.png')
-def layout_image(lid, index):
-    data = STORAGE.get(lid)
+def gallery_page(total, page):
+    """``(page, pages, start, end)`` with ``page`` clamped to the valid range"""
+    pages = max(1, (total + GALLERY_PER_PAGE - 1) // GALLERY_PER_PAGE)
+    page = min(max(page, 1), pages)
+    start = (page - 1) * GALLERY_PER_PAGE
+    return page, pages, start, min(start + GALLERY_PER_PAGE, total)
+
+# "Load more" advances the session's shared LayoutGenerator, so requests for
+# the same session take turns; sessions hash onto a fixed set of locks
+LOAD_MORE_LOCKS = [threading.Lock() for _ in range(64)]
+
+@app.route('/more/<lid>', methods=['POST'])
+def load_more(lid):
+    with LOAD_MORE_LOCKS[hash(lid) % len(LOAD_MORE_LOCKS)]:
+        total = SESSIONS.update(lid, extend_session)
+    if total is None:
+        abort(404)
+    pages = gallery_page(total, 1)[1]
+    return redirect(url_for('gallery', lid=lid, page=pages))
+
+def extend_session(data):
+    """Add LOAD_MORE_COUNT layouts to a session; returns its layout count"""
+    generator = data.get('generator')
+    if generator is None:
+        # Sessions saved before jobs kept a generator for cached results:
+        # resume from their signatures after the seed range they covered
+        generator = LayoutGenerator(data['rooms'], data['plot_w'], data['plot_h'],
+                                    seed=data['seed'] + data['max_attempts'],
+                                    min_distance=data.get('min_distance'))
+        generator.remember(data['layouts'])
+        data['generator'] = generator
+    elif generator.index is not None and not len(generator.index):
+        # The similarity index is not saved with the session
+        generator.remember(data['layouts'])
+
+    generator.stats = new_stats()
+    data['layouts'].extend(generator.next(LOAD_MORE_COUNT))
+    record_stats(generator.stats)
+    generator.stats = None
+    return len(data['layouts'])
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of the search and job counters"""
+    lines = ["# HELP layout_jobs Generation jobs known to this process by status.",
+             "# TYPE layout_jobs gauge"]
+    lines += [f'layout_jobs{{status="{status}"}} {count}' for status, count in JOBS.counts().items()]
+    caches = {'shelf': SHELF_CACHE.stats()}
+    for field, metric, kind, help_text in (
+            ('hits', 'hits_total', 'counter', "Packing cache lookups answered from the cache."),
+            ('misses', 'misses_total', 'counter', "Packing cache lookups that had to solve."),
+            ('evictions', 'evictions_total', 'counter', "Packing cache entries evicted by the LRU."),
+            ('entries', 'entries', 'gauge', "Packing cache entries held.")):
+        lines.append(f"# HELP layout_packing_cache_{metric} {help_text}")
+        lines.append(f"# TYPE layout_packing_cache_{metric} {kind}")
+        lines += [f'layout_packing_cache_{metric}{{cache="{name}"}} {stats[field]}'
+                  for name, stats in caches.items()]
+    text = "\n".join(lines) + "\n"
+    if METRICS is not None:
+        with METRICS_LOCK:
+            text += METRICS.to_prometheus()
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+class RenderCache:
+    """Thread-safe LRU of rendered images, bounded by their total size in bytes"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            if key in self._items:
+                self._size -= len(self._items.pop(key))
+            self._items[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+RENDER_CACHE = RenderCache()
+
+def render_png(layout, plot_w, plot_h, rooms, size, dpi):
+    # matplotlib is imported on first use so workers that only serve the
+    # raster/SVG renderers never load it. A standalone Figure (not pyplot)
+    # keeps concurrent requests from sharing pyplot's global figure state
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(size, size), dpi=dpi)
+    ax = fig.subplots()
+    draw_layout(ax, layout, plot_w, plot_h, rooms)
+    buf = io.BytesIO()
+    fig.tight_layout()
+    fig.savefig(buf, format='png', bbox_inches='tight')
+    return buf.getvalue()
+
+def render_sprite_png(layouts, plot_w, plot_h, rooms, tile, dpi=90):
+    """One Figure with a tile per layout, saved in a single pass. No
+    tight bbox, so tile ``k`` sits exactly at x offset ``k * tile``"""
+    from matplotlib.figure import Figure
+
+    n = len(layouts)
+    fig = Figure(figsize=(n * tile / dpi, tile / dpi), dpi=dpi)
+    pad = 4 / tile
+    for k, layout in enumerate(layouts):
+        ax = fig.add_axes([(k + pad) / n, pad, (1 - 2 * pad) / n, 1 - 2 * pad])
+        draw_layout(ax, layout, plot_w, plot_h, rooms)
+        ax.set_axis_off()
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+def image_response(key, mimetype, render):
+    """Serve ``render()``'s bytes through RENDER_CACHE with ETag/304 handling"""
+    # Layouts never change once stored, so the key alone identifies the image
+    etag = hashlib.sha1(repr(key).encode()).hexdigest()
+    headers = {'Cache-Control': 'public, max-age=86400'}
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    body = RENDER_CACHE.get(key)
+    if body is None:
+        body = render()
+        RENDER_CACHE.put(key, body)
+
+    response = Response(body, mimetype=mimetype, headers=headers)
+    response.set_etag(etag)
+    return response
+
+def get_layout(lid, index):
+    data = SESSIONS.get(lid)
     if not data:
         abort(404)
     layouts = data['layouts']
     if index < 0 or index >= len(layouts):
         abort(404)
-    layout = layouts[index]
+    return data, layouts[index]
+
+@app.route('/image/<lid>/<int:index>.png')
+def layout_image(lid, index):
+    data, layout = get_layout(lid, index)
 
-    fig, ax = plt.subplots(figsize=(6,6), dpi=100)
     try:
-        draw_layout(ax, layout, data['plot_w'], data['plot_h'], data['rooms'])
-        buf = io.BytesIO()
-        fig.tight_layout()
-        fig.savefig(buf, format='png', bbox_inches='tight')
-        buf.seek(0)
-        return send_file(buf, mimetype='image/png')
-    finally:
-        plt.close(fig)
+        size = float(request.args.get('size', 6))
+        dpi = int(request.args.get('dpi', 100))
+    except ValueError:
+        abort(400)
+    if not math.isfinite(size):
+        abort(400)
+    # At most 12 in at 200 dpi, i.e. 2400 px a side
+    size = min(max(size, 1), 12)
+    dpi = min(max(dpi, 30), 200)
+    renderer = request.args.get('renderer', 'raster' if RENDERER in ('raster', 'svg') else 'matplotlib')
+    if renderer not in ('matplotlib', 'raster'):
+        abort(400)
+
+    if renderer == 'raster':
+        render = lambda: layout_to_png(layout, data['plot_w'], data['plot_h'], int(size * dpi))
+    else:
+        render = lambda: render_png(layout, data['plot_w'], data['plot_h'], data['rooms'], size, dpi)
+    return image_response((lid, index, size, dpi, renderer), 'image/png', render)
+
+@app.route('/image/<lid>/<int:index>.svg')
+def layout_svg(lid, index):
+    data, layout = get_layout(lid, index)
+    render = lambda: layout_to_svg(layout, data['plot_w'], data['plot_h']).encode()
+    return image_response((lid, index, 'svg'), 'image/svg+xml', render)
+
+@app.route('/sprite/<lid>/<int:page>')
+def gallery_sprite(lid, page):
+    """Thumbnails of one gallery page as a single image, ``SPRITE_TILE`` px
+    per layout from left to right"""
+    data = SESSIONS.get(lid)
+    if not data or not data['layouts']:
+        abort(404)
+    page, _, start, end = gallery_page(len(data['layouts']), page)
+    layouts = data['layouts'][start:end]
+    # Keyed by the count too: the last page grows when more layouts are loaded
+    key = ('sprite', lid, page, len(layouts), RENDERER)
+    if RENDERER == 'svg':
+        render = lambda: sprite_to_svg(layouts, data['plot_w'], data['plot_h'], SPRITE_TILE).encode()
+        return image_response(key, 'image/svg+xml', render)
+    if RENDERER == 'raster':
+        render = lambda: sprite_to_png(layouts, data['plot_w'], data['plot_h'], SPRITE_TILE)
+    else:
+        render = lambda: render_sprite_png(layouts, data['plot_w'], data['plot_h'], data['rooms'], SPRITE_TILE)
+    return image_response(key, 'image/png', render)
+
+@app.route('/export/<lid>.npz')
+def export_session(lid):
+    """All layouts of a session as a columnar .npz (see layout_export)"""
+    from layout_export import export_layouts
+
+    data = SESSIONS.get(lid)
+    if not data:
+        abort(404)
+    buf = io.BytesIO()
+    export_layouts(data['layouts'], buf, data['plot_w'], data['plot_h'])
+    return Response(buf.getvalue(), mimetype='application/octet-stream',
+                    headers={'Content-Disposition': f'attachment; filename=layouts-{lid}.npz'})
+
+@app.context_processor
+def image_helpers():
+    def image_url(lid, index):
+        """SVG when RENDERER is 'svg', otherwise a PNG"""
+        if RENDERER == 'svg':
+            return url_for('layout_svg', lid=lid, index=index)
+        return url_for('layout_image', lid=lid, index=index)
+    return {'image_url': image_url}
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=False)
@@ -0,0 +1,258 @@
+"""Background layout generation for the Flask app.
+
+``/generate`` used to search on the request thread. Here each request
+becomes a ``Job`` run by a small pool of worker threads, so the request
+returns at once and only ``workers`` searches run at the same time no matter
+how many are submitted. A job publishes its progress (attempts, layouts,
+ETA) while it runs and can be cancelled between attempts.
+
+Jobs live in the memory of the process that accepted them; with several
+gunicorn workers, route ``/jobs/...`` with sticky sessions or run one worker.
+"""
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from allocate import LayoutGenerator, cache_key, search_until
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+FINISHED = (DONE, CANCELLED, FAILED)
+
+
+class Job:
+    def __init__(self, rooms, plot_width, plot_height, max_layouts, max_attempts, seed=0,
+                 owner=None, cache=None, stats=None, min_distance=None, deadline_ms=None,
+                 min_rooms=1, packer='greedy', adaptive=False):
+        self.id = str(uuid.uuid4())
+        self.rooms = rooms
+        self.plot_width = plot_width
+        self.plot_height = plot_height
+        self.max_layouts = max_layouts
+        self.max_attempts = max_attempts
+        self.seed = seed
+        self.min_rooms = min_rooms
+        self.packer = packer
+        self.adaptive = adaptive
+        self.min_distance = min_distance
+        self.deadline_ms = deadline_ms
+        self.deadline_hit = None
+        self.owner = owner
+        self.cache = cache
+        self.stats = stats
+        self.status = QUEUED
+        self.error = None
+        self.layouts = []
+        self.generator = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+
+    @property
+    def attempts(self):
+        return 0 if self.generator is None else self.generator.attempts
+
+    def cancel(self):
+        self._cancel.set()
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def eta(self):
+        """Seconds until the job is expected to finish, or None if unknown.
+
+        The search ends at ``max_attempts`` or ``max_layouts``, whichever is
+        first, so both rates are extrapolated and the sooner one wins. With a
+        ``deadline_ms`` it is simply the time left.
+        """
+        if self.status != RUNNING or not self.attempts:
+            return None
+        elapsed = time.time() - self.started
+        if self.deadline_ms is not None:
+            return max(self.deadline_ms / 1000 - elapsed, 0.0)
+        estimates = [elapsed * (self.max_attempts - self.attempts) / self.attempts]
+        if self.layouts:
+            estimates.append(elapsed * (self.max_layouts - len(self.layouts)) / len(self.layouts))
+        return max(min(estimates), 0.0)
+
+    def progress(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "layouts": len(self.layouts),
+            "max_layouts": self.max_layouts,
+            "deadline_ms": self.deadline_ms,
+            "deadline_hit": self.deadline_hit,
+            "eta": self.eta(),
+            "elapsed": (self.finished or time.time()) - self.started if self.started else 0.0,
+            "error": self.error,
+        }
+
+    def run(self, on_finish=None):
+        """Search in the calling thread; mirrors ``generate_layouts`` (same
+        seeds, same cache key) so results match the inline path.
+
+        ``on_finish(job)`` is called before the final status is published,
+        so whatever it stores is in place once a poller sees ``done``.
+        """
+        self.started = time.time()
+        status = CANCELLED
+        try:
+            if not self.cancelled():
+                self.status = RUNNING
+                status = self._search()
+            if on_finish is not None:
+                on_finish(self)
+        except Exception as e:
+            self.error = str(e)
+            status = FAILED
+        self.finished = time.time()
+        self.status = status
+
+    def _collect(self, found):
+        for layout in found:
+            self.layouts.append(layout)
+            if len(self.layouts) >= self.max_layouts:
+                break
+
+    def _new_generator(self):
+        self.generator = LayoutGenerator(self.rooms, self.plot_width, self.plot_height,
+                                         seed=self.seed, min_rooms=self.min_rooms,
+                                         packer=self.packer, stats=self.stats,
+                                         min_distance=self.min_distance, adaptive=self.adaptive)
+        return self.generator
+
+    def _publish(self, layouts):
+        self.layouts = layouts
+
+    def _search_until(self):
+        """Anytime search bounded by ``deadline_ms``; never cached, as the
+        result depends on machine speed. The best layouts so far are
+        published as they improve, so progress and a cancelled job show them."""
+        deadline = time.monotonic() + self.deadline_ms / 1000
+        self.layouts, self.deadline_hit = search_until(self._new_generator(), self.max_layouts,
+                                                       deadline, self.cancelled, self._publish)
+        return CANCELLED if self.cancelled() else DONE
+
+    def _search(self):
+        if self.deadline_ms is not None:
+            return self._search_until()
+        key = None
+        if self.cache is not None:
+            key = cache_key(self.cache, self.rooms, self.plot_width, self.plot_height,
+                            self.max_layouts, self.max_attempts, self.seed, self.min_rooms,
+                            self.packer, self.min_distance, self.adaptive)
+            # Entries without a resume point (written by the CLI) are searched
+            # again, so "Load more" continues from the same seed either way
+            cached = self.cache.get_entry(key, self.rooms)
+            if cached is not None and cached[1] is None:
+                cached = None
+            if self.stats is not None:
+                if cached is None:
+                    self.stats.cache_misses += 1
+                else:
+                    self.stats.cache_hits += 1
+            if cached is not None:
+                self.layouts, resume = cached
+                generator = self._new_generator()
+                generator.next_seed = resume['next_seed']
+                generator.attempts = resume['attempts']
+                generator.remember(self.layouts)
+                return DONE
+
+        found = self._new_generator().iter(self.max_attempts, should_stop=self.cancelled)
+        if self.stats is None:
+            self._collect(found)
+        else:
+            with self.stats.measure():
+                self._collect(found)
+
+        if self.cancelled():
+            return CANCELLED
+        if key is not None:
+            self.cache.put(key, self.layouts, {'next_seed': self.generator.next_seed,
+                                               'attempts': self.generator.attempts})
+        return DONE
+
+
+class JobQueue:
+    """FIFO of jobs served by ``workers`` threads.
+
+    ``max_per_owner`` caps the unfinished jobs one owner (e.g. a client
+    address) may have, and finished jobs are forgotten after ``keep_finished``
+    newer ones have finished. Searches run outside the queue (such as a
+    streamed one) count against the same cap between ``hold`` and
+    ``release``.
+    """
+
+    def __init__(self, workers=2, max_per_owner=3, keep_finished=500, on_finish=None):
+        self.max_per_owner = max_per_owner
+        self.keep_finished = keep_finished
+        self.on_finish = on_finish
+        self._jobs = OrderedDict()
+        self._held = Counter()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='layout-job')
+
+    def submit(self, job):
+        """Queue ``job``; returns False if its owner already has too many"""
+        with self._lock:
+            if job.owner is not None and self._active(job.owner) >= self.max_per_owner:
+                return False
+            self._jobs[job.id] = job
+            self._prune()
+        self._pool.submit(self._run, job)
+        return True
+
+    def hold(self, owner):
+        """Count one search run elsewhere against ``owner``; returns False
+        (and counts nothing) if the owner is already at the cap"""
+        with self._lock:
+            if self._active(owner) >= self.max_per_owner:
+                return False
+            self._held[owner] += 1
+            return True
+
+    def release(self, owner):
+        with self._lock:
+            self._held[owner] -= 1
+            if self._held[owner] <= 0:
+                del self._held[owner]
+
+    def _active(self, owner):
+        return self._held[owner] + sum(1 for j in self._jobs.values()
+                                       if j.owner == owner and j.status not in FINISHED)
+
+    def _run(self, job):
+        job.run(self.on_finish)
+
+    def _prune(self):
+        finished = [jid for jid, j in self._jobs.items() if j.status in FINISHED]
+        for jid in finished[:max(len(finished) - self.keep_finished, 0)]:
+            del self._jobs[jid]
+
+    def counts(self):
+        """Number of known jobs per status"""
+        with self._lock:
+            counts = dict.fromkeys((QUEUED, RUNNING) + FINISHED, 0)
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
@@ -0,0 +1,153 @@
+"""Persistent, content-addressed cache of generated layouts.
+
+Entries live in a SQLite file keyed by a hash of everything that determines
+the output of ``generate_layouts``: the room list, plot size, corridor width
+and the seed range/search parameters. Values are the layouts' placements and
+corridors in a compact binary form, plus optionally where the search
+stopped so it can be resumed; the least recently used entries are evicted
+once the cache holds more than ``max_entries``. SQLite's own locking
+makes one cache file safe to share between the CLI, Flask threads and
+gunicorn workers.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from array import array
+from contextlib import contextmanager
+
+from allocate import CORRIDOR_WIDTH, Corridor, CorridorType, Layout, room_specs
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    'LAYOUT_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'layout_cache.sqlite'),
+)
+
+# Bump when the encoding or the generator's output for given inputs changes
+FORMAT_VERSION = 1
+
+
+def encode_layouts(layouts):
+    """Pack layouts into bytes: a count, then per layout the placement and
+    corridor counts followed by ``(index, x, y, rotated)`` and
+    ``(pos, type, start, end)`` quadruples, all as native 32-bit ints."""
+    data = array('i', [len(layouts)])
+    for layout in layouts:
+        data.extend((len(layout.placements) // 4, len(layout.corridors)))
+        data.extend(layout.placements)
+        for c in layout.corridors:
+            data.extend((c.pos, c.type.value, c.start, c.end))
+    return data.tobytes()
+
+
+def decode_layouts(blob, specs):
+    """Inverse of ``encode_layouts``; ``specs`` are the room specs the
+    placement indices refer to"""
+    data = array('i')
+    data.frombytes(blob)
+    layouts = []
+    pos = 1
+    for _ in range(data[0]):
+        n_placements, n_corridors = data[pos], data[pos + 1]
+        pos += 2
+        placements = data[pos:pos + 4 * n_placements]
+        pos += 4 * n_placements
+        corridors = []
+        for _ in range(n_corridors):
+            cpos, kind, start, end = data[pos:pos + 4]
+            corridors.append(Corridor(cpos, CorridorType(kind), start, end))
+            pos += 4
+        layouts.append(Layout.from_placements(corridors, specs, placements))
+    return layouts
+
+
+def make_key(rooms, plot_width, plot_height, **params):
+    """Hash of the generation inputs.
+
+    Room order is part of the key: the generator shuffles the list it is
+    given, so the same multiset in another order yields other layouts.
+    """
+    payload = {
+        'version': FORMAT_VERSION,
+        'rooms': [list(spec) for spec in room_specs(rooms)],
+        'plot': [plot_width, plot_height],
+        'corridor_width': CORRIDOR_WIDTH,
+        'params': params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class LayoutCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=1000):
+        self.path = path
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS layouts ('
+                ' key TEXT PRIMARY KEY, data BLOB NOT NULL, last_used REAL NOT NULL,'
+                ' resume TEXT)'
+            )
+            # Cache files created before entries carried a resume point
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(layouts)')]
+            if 'resume' not in columns:
+                conn.execute('ALTER TABLE layouts ADD COLUMN resume TEXT')
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call keeps the cache usable from any thread
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    make_key = staticmethod(make_key)
+
+    def get(self, key, rooms):
+        """Cached layouts for ``key`` (built over ``rooms``), or None"""
+        entry = self.get_entry(key, rooms)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key, rooms):
+        """``(layouts, resume)`` for ``key``, or None; ``resume`` is the dict
+        given to ``put``, or None if the entry was stored without one"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT data, resume FROM layouts WHERE key = ?',
+                               (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE layouts SET last_used = ? WHERE key = ?', (time.time(), key))
+        return decode_layouts(row[0], room_specs(rooms)), row[1] and json.loads(row[1])
+
+    def put(self, key, layouts, resume=None):
+        """Store ``layouts``; ``resume`` (a JSON-able dict, such as a
+        generator's ``next_seed`` and ``attempts``) says where to continue"""
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO layouts (key, data, last_used, resume) '
+                         'VALUES (?, ?, ?, ?)',
+                         (key, encode_layouts(layouts), time.time(),
+                          None if resume is None else json.dumps(resume)))
+            conn.execute('DELETE FROM layouts WHERE key IN ('
+                         ' SELECT key FROM layouts ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                         (self.max_entries,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM layouts')
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM layouts').fetchone()[0]
+
+
+_default_cache = None
+
+
+def default_cache():
+    """Process-wide cache at ``DEFAULT_CACHE_PATH`` (override with $LAYOUT_CACHE)"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = LayoutCache()
+    return _default_cache
@@ -0,0 +1,161 @@
+"""Columnar export of layout batches for bulk consumers.
+
+A batch is a set of flat NumPy columns:
+
+* ``spec_id``, ``spec_width``, ``spec_height``: the distinct rooms (``RoomSpec``)
+  the placements refer to,
+* ``room``, ``room_id``, ``x``, ``y``, ``rotated``: one row per placed room,
+  ``room`` indexing the spec columns,
+* ``corridor_pos``, ``corridor_type``, ``corridor_start``, ``corridor_end``:
+  one row per corridor (``corridor_type`` is ``CorridorType.value``),
+* ``room_offsets``, ``corridor_offsets``: ``n + 1`` row offsets, so layout
+  ``i`` owns rows ``offsets[i]:offsets[i + 1]``,
+* ``plot``: ``[plot_width, plot_height]`` and ``version``: ``[FORMAT_VERSION]``.
+
+``export_layouts`` writes them either as a directory of ``.npy`` files, which
+``load_layouts`` memory-maps so nothing is read until it is touched, or as a
+single uncompressed ``.npz`` (what the web app serves for download), which is
+read into memory on load.
+
+``LayoutBatch`` exposes the columns directly for vectorized scoring and
+builds ``Layout`` objects only for the rows that are indexed.
+"""
+import os
+from array import array
+
+import numpy as np
+
+from allocate import Corridor, CorridorType, Layout, RoomSpec
+
+FORMAT_VERSION = 1
+
+COLUMNS = ('spec_id', 'spec_width', 'spec_height', 'room', 'room_id', 'x', 'y', 'rotated',
+           'corridor_pos', 'corridor_type', 'corridor_start', 'corridor_end',
+           'room_offsets', 'corridor_offsets', 'plot', 'version')
+
+
+def layout_columns(layouts, plot_width, plot_height):
+    """Dict of column name -> array for ``layouts``"""
+    spec_index = {}
+    placements = array('i')
+    remap_runs = []  # (first placement row, remap array) per run of layouts sharing specs
+    corridors = array('i')
+    room_offsets = np.zeros(len(layouts) + 1, dtype=np.int64)
+    corridor_offsets = np.zeros(len(layouts) + 1, dtype=np.int64)
+    last_specs = None
+
+    for i, layout in enumerate(layouts):
+        if layout.specs is not last_specs:
+            last_specs = layout.specs
+            remap = np.array([spec_index.setdefault(spec, len(spec_index)) for spec in last_specs],
+                             dtype=np.int32)
+            remap_runs.append((len(placements) // 4, remap))
+        placements.extend(layout.placements)
+        for c in layout.corridors:
+            corridors.extend((c.pos, c.type.value, c.start, c.end))
+        room_offsets[i + 1] = len(placements) // 4
+        corridor_offsets[i + 1] = len(corridors) // 4
+
+    rows = np.frombuffer(placements, dtype=np.int32).reshape(-1, 4) if placements else \
+        np.zeros((0, 4), dtype=np.int32)
+    room = np.empty(len(rows), dtype=np.int32)
+    bounds = [start for start, _ in remap_runs[1:]] + [len(rows)]
+    for (start, remap), stop in zip(remap_runs, bounds):
+        room[start:stop] = remap[rows[start:stop, 0]]
+    corridor_rows = np.frombuffer(corridors, dtype=np.int32).reshape(-1, 4) if corridors else \
+        np.zeros((0, 4), dtype=np.int32)
+
+    specs = list(spec_index)
+    spec_id = np.array([s.id for s in specs], dtype=np.int32)
+    return {
+        'spec_id': spec_id,
+        'spec_width': np.array([s.width for s in specs], dtype=np.int32),
+        'spec_height': np.array([s.height for s in specs], dtype=np.int32),
+        'room': room,
+        'room_id': spec_id[room] if len(specs) else np.zeros(0, dtype=np.int32),
+        'x': rows[:, 1].copy(),
+        'y': rows[:, 2].copy(),
+        'rotated': rows[:, 3].astype(np.uint8),
+        'corridor_pos': corridor_rows[:, 0].copy(),
+        'corridor_type': corridor_rows[:, 1].astype(np.uint8),
+        'corridor_start': corridor_rows[:, 2].copy(),
+        'corridor_end': corridor_rows[:, 3].copy(),
+        'room_offsets': room_offsets,
+        'corridor_offsets': corridor_offsets,
+        'plot': np.array([plot_width, plot_height], dtype=np.int32),
+        'version': np.array([FORMAT_VERSION], dtype=np.int32),
+    }
+
+
+def export_layouts(layouts, path, plot_width, plot_height):
+    """Write ``layouts`` to ``path``: a ``.npz`` file (``path`` may also be a
+    binary file object) or, for any other name, a directory of ``.npy`` files"""
+    columns = layout_columns(layouts, plot_width, plot_height)
+    if not isinstance(path, (str, os.PathLike)) or str(path).endswith('.npz'):
+        np.savez(path, **columns)
+        return
+    os.makedirs(path, exist_ok=True)
+    for name, column in columns.items():
+        np.save(os.path.join(path, name + '.npy'), column)
+
+
+class LayoutBatch:
+    """Read-only view of an exported batch.
+
+    ``columns`` maps names to arrays (memory-mapped for a directory);
+    ``batch[i]`` and iteration build ``Layout`` objects on demand.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        version = int(columns['version'][0])
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported layout batch version {version}")
+        self.plot_width, self.plot_height = (int(v) for v in columns['plot'])
+        self.specs = tuple(RoomSpec(int(i), int(w), int(h)) for i, w, h in
+                           zip(columns['spec_id'], columns['spec_width'], columns['spec_height']))
+        self.room_offsets = columns['room_offsets']
+        self.corridor_offsets = columns['corridor_offsets']
+
+    def __len__(self):
+        return len(self.room_offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        c = self.columns
+        start, stop = self.room_offsets[index], self.room_offsets[index + 1]
+        rows = np.empty((stop - start, 4), dtype=np.int32)
+        rows[:, 0] = c['room'][start:stop]
+        rows[:, 1] = c['x'][start:stop]
+        rows[:, 2] = c['y'][start:stop]
+        rows[:, 3] = c['rotated'][start:stop]
+        placements = array('i')
+        placements.frombytes(rows.tobytes())
+
+        start, stop = self.corridor_offsets[index], self.corridor_offsets[index + 1]
+        corridors = [Corridor(pos, CorridorType(kind), s, e)
+                     for pos, kind, s, e in zip(c['corridor_pos'][start:stop].tolist(),
+                                                c['corridor_type'][start:stop].tolist(),
+                                                c['corridor_start'][start:stop].tolist(),
+                                                c['corridor_end'][start:stop].tolist())]
+        return Layout.from_placements(corridors, self.specs, placements)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+def load_layouts(path):
+    """``LayoutBatch`` for a batch written by ``export_layouts`` (a directory,
+    a ``.npz`` file or a binary file object holding one)"""
+    if isinstance(path, (str, os.PathLike)) and os.path.isdir(path):
+        columns = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+                   for name in COLUMNS}
+    else:
+        # Members of an .npz are re-read on every access, so load them once
+        with np.load(path) as data:
+            columns = {name: data[name] for name in COLUMNS}
+    return LayoutBatch(columns)
@@ -0,0 +1,328 @@
+"""Improve generated layouts by simulated annealing.
+
+``generate_layouts`` keeps the first acceptable layouts of independent
+random restarts. Here a layout is turned into an editable state:
+
+* the corridor split tree, each split stored as an offset inside its zone,
+* a packing priority over all rooms,
+* a preferred orientation per room.
+
+The state is decoded by packing the zones in tree order with the same shelf
+rule as ``place_rooms``, taking rooms by priority and trying each room's
+preferred orientation first. Local moves shift a corridor, swap two rooms'
+priorities, flip a room's preferred orientation or reshuffle the rooms of
+one zone; simulated annealing accepts or rejects them against an objective
+from ``OBJECTIVES`` until the time budget (or ``max_iterations``) runs out.
+Layouts breaking the 70% area rule are never accepted.
+"""
+import math
+import random
+import time
+from array import array
+
+from allocate import CORRIDOR_WIDTH, Corridor, CorridorType, Layout, LayoutGenerator
+
+
+class Split:
+    __slots__ = ('horizontal', 'offset', 'first', 'second')
+
+    def __init__(self, horizontal, offset, first=None, second=None):
+        self.horizontal = horizontal
+        self.offset = offset
+        self.first = first
+        self.second = second
+
+    def copy(self):
+        return Split(self.horizontal, self.offset,
+                     self.first.copy() if self.first else None,
+                     self.second.copy() if self.second else None)
+
+
+def parse_tree(corridors, x, y, width, height, pos=0):
+    """Rebuild the split tree from corridors in the generator's pre-order.
+
+    Returns ``(tree, next_pos)``; a leaf zone is ``None``.
+    """
+    if pos < len(corridors):
+        c = corridors[pos]
+        if c.type == CorridorType.HORIZONTAL and c.start == x and c.end == x + width and y < c.pos < y + height:
+            offset = c.pos - y
+            first, pos = parse_tree(corridors, x, y, width, offset, pos + 1)
+            second, pos = parse_tree(corridors, x, y + offset + CORRIDOR_WIDTH, width,
+                                     height - offset - CORRIDOR_WIDTH, pos)
+            return Split(True, offset, first, second), pos
+        if c.type == CorridorType.VERTICAL and c.start == y and c.end == y + height and x < c.pos < x + width:
+            offset = c.pos - x
+            first, pos = parse_tree(corridors, x, y, offset, height, pos + 1)
+            second, pos = parse_tree(corridors, x + offset + CORRIDOR_WIDTH, y,
+                                     width - offset - CORRIDOR_WIDTH, height, pos)
+            return Split(False, offset, first, second), pos
+    return None, pos
+
+
+def tree_zones(tree, x, y, width, height, min_zone_dim, corridors, zones):
+    """Append the tree's corridors and leaf zones (pre-order) to the given
+    lists. Returns False if a split leaves a side thinner than ``min_zone_dim``."""
+    if tree is None:
+        zones.append((x, y, width, height))
+        return True
+    length = height if tree.horizontal else width
+    if not min_zone_dim <= tree.offset <= length - CORRIDOR_WIDTH - min_zone_dim:
+        return False
+    offset = tree.offset
+    if tree.horizontal:
+        corridors.append(Corridor(y + offset, CorridorType.HORIZONTAL, x, x + width))
+        return (tree_zones(tree.first, x, y, width, offset, min_zone_dim, corridors, zones) and
+                tree_zones(tree.second, x, y + offset + CORRIDOR_WIDTH, width,
+                           height - offset - CORRIDOR_WIDTH, min_zone_dim, corridors, zones))
+    corridors.append(Corridor(x + offset, CorridorType.VERTICAL, y, y + height))
+    return (tree_zones(tree.first, x, y, offset, height, min_zone_dim, corridors, zones) and
+            tree_zones(tree.second, x + offset + CORRIDOR_WIDTH, y, width - offset - CORRIDOR_WIDTH,
+                       height, min_zone_dim, corridors, zones))
+
+
+def tree_splits(tree):
+    if tree is None:
+        return []
+    return [tree] + tree_splits(tree.first) + tree_splits(tree.second)
+
+
+def pack_zone(specs, order, x, y, zone_width, zone_height, rotate):
+    """Shelf packing as in ``place_rooms`` without the randomness: rooms are
+    taken in ``order`` and ``rotate[i]`` picks the orientation tried first.
+    Returns ``(placements, unplaced)``."""
+    placements = []
+    unplaced = order
+    curr_y = y
+
+    while unplaced and curr_y < y + zone_height:
+        curr_x = x
+        row_ht = 0
+        skipped = []
+        for i in unplaced:
+            room = specs[i]
+            w, h = (room.height, room.width) if rotate[i] else (room.width, room.height)
+            if curr_x + w <= x + zone_width and curr_y + h <= y + zone_height:
+                placements.append((i, curr_x, curr_y, rotate[i]))
+            elif curr_x + h <= x + zone_width and curr_y + w <= y + zone_height:
+                placements.append((i, curr_x, curr_y, not rotate[i]))
+                w, h = h, w
+            else:
+                skipped.append(i)
+                continue
+            curr_x += w
+            row_ht = max(row_ht, h)
+
+        if len(skipped) == len(unplaced):
+            break
+        unplaced = skipped
+        curr_y += row_ht
+
+    return placements, unplaced
+
+
+def _rooms_objective(layout, plot_area, corridor_area):
+    # Placed rooms first, area used as the tie-breaker
+    return len(layout.placements) // 4 + layout.get_room_area() / plot_area
+
+
+def _area_objective(layout, plot_area, corridor_area):
+    return layout.get_room_area() / plot_area
+
+
+def _compact_objective(layout, plot_area, corridor_area):
+    # Area used, minus half the plot given over to corridors
+    return (layout.get_room_area() - 0.5 * corridor_area) / plot_area
+
+
+OBJECTIVES = {
+    'rooms': _rooms_objective,
+    'area': _area_objective,
+    'compact': _compact_objective,
+}
+
+
+class AnnealingState:
+    """Split tree, room priority and orientation preferences of one candidate"""
+
+    def __init__(self, specs, plot_width, plot_height, tree, order, rotate):
+        self.specs = specs
+        self.plot_width = plot_width
+        self.plot_height = plot_height
+        self.tree = tree
+        self.order = order
+        self.rotate = rotate
+        self.zone_rooms = []
+
+    @classmethod
+    def from_layout(cls, layout, plot_width, plot_height):
+        tree, _ = parse_tree(layout.corridors, 0, 0, plot_width, plot_height)
+        placements = layout.placements
+        placed = [placements[k] for k in range(0, len(placements), 4)]
+        rotate = [False] * len(layout.specs)
+        for k in range(0, len(placements), 4):
+            rotate[placements[k]] = bool(placements[k + 3])
+        placed_set = set(placed)
+        unplaced = [i for i in range(len(layout.specs)) if i not in placed_set]
+        return cls(layout.specs, plot_width, plot_height, tree, placed + unplaced, rotate)
+
+    def copy(self):
+        return AnnealingState(self.specs, self.plot_width, self.plot_height,
+                              self.tree.copy() if self.tree else None,
+                              list(self.order), list(self.rotate))
+
+    def decode(self, min_zone_dim):
+        """The state's ``Layout`` (and corridor area), or ``(None, 0)`` if the tree is invalid"""
+        corridors, zones = [], []
+        if not tree_zones(self.tree, 0, 0, self.plot_width, self.plot_height, min_zone_dim,
+                          corridors, zones):
+            return None, 0
+        placements = array('i')
+        remaining = self.order
+        self.zone_rooms = []
+        for x, y, width, height in zones:
+            placed, remaining = pack_zone(self.specs, remaining, x, y, width, height, self.rotate)
+            self.zone_rooms.append([p[0] for p in placed])
+            for placement in placed:
+                placements.extend(placement)
+        corridor_area = sum((c.end - c.start) * CORRIDOR_WIDTH for c in corridors)
+        return Layout.from_placements(corridors, self.specs, placements), corridor_area
+
+
+def _neighbour(state, rng, min_zone_dim):
+    """A copy of ``state`` with one random local move applied"""
+    new = state.copy()
+    n = len(new.order)
+    splits = tree_splits(new.tree)
+    move = rng.random()
+
+    if move < 0.3 and splits:
+        # Shift a corridor by up to a quarter of the zone's smallest room side
+        split = rng.choice(splits)
+        step = max(1, min_zone_dim // 4)
+        split.offset += rng.choice((-1, 1)) * rng.randint(1, step)
+    elif move < 0.6 and n > 1:
+        i, j = rng.sample(range(n), 2)
+        new.order[i], new.order[j] = new.order[j], new.order[i]
+    elif move < 0.8:
+        i = rng.randrange(len(new.rotate))
+        new.rotate[i] = not new.rotate[i]
+    else:
+        # Re-pack one zone: reshuffle its rooms together with the unplaced ones
+        zones = [rooms for rooms in state.zone_rooms if rooms]
+        placed = set(i for rooms in state.zone_rooms for i in rooms)
+        pool = set(rng.choice(zones) if zones else []) | set(i for i in new.order if i not in placed)
+        positions = [k for k, i in enumerate(new.order) if i in pool]
+        shuffled = [new.order[k] for k in positions]
+        rng.shuffle(shuffled)
+        for k, i in zip(positions, shuffled):
+            new.order[k] = i
+    return new
+
+
+def optimize_layout(layout, plot_width, plot_height, time_budget=1.0, max_iterations=None,
+                    objective='rooms', seed=0, t_start=0.5, t_end=0.005):
+    """Anneal from ``layout``; returns ``(best layout, its score)``.
+
+    The temperature falls geometrically from ``t_start`` to ``t_end`` over
+    the time budget, or over ``max_iterations`` when that is given (which
+    also makes the run reproducible from ``seed``). The result is never
+    worse than ``layout`` itself; with no time left it is ``layout``.
+    """
+    score_fn = OBJECTIVES[objective]
+    plot_area = plot_width * plot_height
+    max_area = plot_area * 0.7
+    specs = layout.specs
+    min_zone_dim = min(min(r.width, r.height) for r in specs)
+    rng = random.Random(seed)
+
+    def evaluate(state):
+        candidate, corridor_area = state.decode(min_zone_dim)
+        if candidate is None or not candidate.placements or candidate.get_room_area() > max_area:
+            return None, -math.inf
+        return candidate, score_fn(candidate, plot_area, corridor_area)
+
+    corridor_area = sum((c.end - c.start) * CORRIDOR_WIDTH for c in layout.corridors)
+    best, best_score = layout, score_fn(layout, plot_area, corridor_area)
+    if max_iterations is None and time_budget <= 0:
+        return best, best_score
+    state = AnnealingState.from_layout(layout, plot_width, plot_height)
+    current, current_score = evaluate(state)
+    if current is None:
+        current_score = best_score
+
+    start = time.monotonic()
+    iteration = 0
+    while True:
+        if max_iterations is not None:
+            if iteration >= max_iterations:
+                break
+            progress = iteration / max_iterations
+        else:
+            progress = (time.monotonic() - start) / time_budget
+            if progress >= 1:
+                break
+        iteration += 1
+        temperature = t_start * (t_end / t_start) ** progress
+
+        candidate_state = _neighbour(state, rng, min_zone_dim)
+        candidate, score = evaluate(candidate_state)
+        if candidate is None:
+            continue
+        delta = score - current_score
+        if delta >= 0 or rng.random() < math.exp(delta / temperature):
+            state, current_score = candidate_state, score
+            if score > best_score:
+                best, best_score = candidate, score
+
+    return best, best_score
+
+
+def optimize_layouts(rooms, plot_width, plot_height, max_layouts=10, time_budget=5.0,
+                     objective='rooms', seed=0, starts=None, max_attempts=500):
+    """Generate starting layouts, then anneal the best ``starts`` of them.
+
+    The starting layouts come from ``max_attempts`` restarts from ``seed``, as
+    in ``generate_layouts``, and count against ``time_budget``: generation
+    stops at the deadline and what is left is shared evenly between the
+    annealing runs (none run once it is used up). Returns up to
+    ``max_layouts`` unique layouts, best first.
+    """
+    deadline = time.monotonic() + time_budget
+    starts = starts or max_layouts
+    plot_area = plot_width * plot_height
+    score_fn = OBJECTIVES[objective]
+
+    generator = LayoutGenerator(rooms, plot_width, plot_height, seed=seed)
+    initial = []
+    for layout in generator.iter(max_attempts, deadline):
+        initial.append(layout)
+        if len(initial) >= starts * 5:
+            break
+    print(f"Generated {len(initial)} starting layouts in {generator.attempts} attempts")
+    if not initial:
+        return []
+
+    def score(layout):
+        corridor_area = sum((c.end - c.start) * CORRIDOR_WIDTH for c in layout.corridors)
+        return score_fn(layout, plot_area, corridor_area)
+
+    initial.sort(key=score, reverse=True)
+    initial = initial[:starts]
+    print(f"Annealing {len(initial)} layouts ({objective} objective)...")
+
+    results = []
+    for k, layout in enumerate(initial):
+        budget = max(deadline - time.monotonic(), 0) / (len(initial) - k)
+        results.append(optimize_layout(layout, plot_width, plot_height, time_budget=budget,
+                                       objective=objective, seed=seed + k))
+
+    results.sort(key=lambda r: r[1], reverse=True)
+    layouts = []
+    seen_signatures = set()
+    for layout, _ in results:
+        signature = layout.get_signature()
+        if signature not in seen_signatures:
+            seen_signatures.add(signature)
+            layouts.append(layout)
+    return layouts[:max_layouts]
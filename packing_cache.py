@@ -0,0 +1,69 @@
+"""Bounded in-process caches for zone packing results.
+
+Many attempts split the plot into zones of the same size, and the
+deterministic 'exact' packer gives the same answer for the same zone and
+rooms, so results are keyed on the canonical sub-problem (``zone_key``)
+rather than on positions or room ids:
+
+* the zone's width and height,
+* the sides of the candidate rooms, as a sorted multiset.
+
+Results are stored as shelves of room sides, independent of the zone's
+position and of room ids, so one entry serves every zone of that size with
+the same candidate rooms, anywhere on the plot and in any attempt.
+"""
+import threading
+from collections import OrderedDict
+
+
+def zone_key(zone_width, zone_height, sides):
+    """Canonical key for packing rooms with ``sides`` ((w, h) pairs) into a
+    zone; rooms are unordered and unoriented"""
+    return (zone_width, zone_height, tuple(sorted((min(w, h), max(w, h)) for w, h in sides)))
+
+
+class PackingCache:
+    """Thread-safe LRU with hit, miss and eviction counters"""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Cached value for ``key``, or None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": self.hit_rate()}
@@ -0,0 +1,231 @@
+"""Bounded session stores for the Flask app.
+
+A session is the dict ``/generate`` builds: ``layouts``, ``plot_w``,
+``plot_h``, ``rooms``, ``seed``, ``max_attempts`` and optionally the
+``generator`` used by "Load more". Two backends share a ``get``/``put``/
+``update`` interface:
+
+* ``MemorySessionStore``: in-process LRU with a session count limit and an
+  idle TTL.
+* ``SqliteSessionStore``: sessions serialized compactly into SQLite, so
+  they survive restarts and are shared by all gunicorn workers.
+
+``update`` is the way to change a stored session: it re-reads and re-applies
+the change if another worker stored the session in the meantime.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from allocate import LayoutGenerator, Room, room_specs
+from layout_cache import decode_layouts, encode_layouts
+
+
+class MemorySessionStore:
+    def __init__(self, max_sessions=200, ttl=6 * 3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._sessions:
+            lid, (last_used, _) = next(iter(self._sessions.items()))
+            if now - last_used <= self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[lid]
+
+    def get(self, lid):
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(lid)
+            if entry is None:
+                return None
+            self._sessions[lid] = (now, entry[1])
+            self._sessions.move_to_end(lid)
+            return entry[1]
+
+    def put(self, lid, data):
+        now = time.time()
+        with self._lock:
+            self._sessions[lid] = (now, data)
+            self._sessions.move_to_end(lid)
+            self._expire(now)
+        return True
+
+    def update(self, lid, change):
+        """``change(session)`` for session ``lid``, stored afterwards; returns
+        its result, or None if there is no such session"""
+        data = self.get(lid)
+        if data is None:
+            return None
+        result = change(data)
+        self.put(lid, data)
+        return result
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+def serialize_session(data):
+    """``(meta JSON, layouts blob)`` for a session dict"""
+    meta = {key: data[key] for key in ('plot_w', 'plot_h', 'seed', 'max_attempts')}
+    meta['rooms'] = [list(spec) for spec in room_specs(data['rooms'])]
+    meta['min_distance'] = data.get('min_distance')
+    if data.get('generator') is not None:
+        meta['generator'] = data['generator'].to_state()
+    return json.dumps(meta), encode_layouts(data['layouts'])
+
+
+def deserialize_session(meta_json, blob):
+    return _session_from(*_decode_session(meta_json, blob))
+
+
+def _decode_session(meta_json, blob):
+    """``(meta, layouts)`` with the generator left as its saved state"""
+    meta = json.loads(meta_json)
+    meta['rooms'] = [Room(*spec) for spec in meta['rooms']]
+    return meta, tuple(decode_layouts(blob, room_specs(meta['rooms'])))
+
+
+def _session_from(meta, layouts):
+    """A new session dict; shares only the immutable layouts with ``meta``"""
+    data = {key: value for key, value in meta.items() if key != 'generator'}
+    data['rooms'] = list(meta['rooms'])
+    data['layouts'] = list(layouts)
+    state = meta.get('generator')
+    data['generator'] = LayoutGenerator.from_state(state) if state else None
+    return data
+
+
+class SessionConflict(Exception):
+    """A session kept changing under ``update``"""
+
+
+class SqliteSessionStore:
+    """Sessions in a SQLite file, safe for several worker processes.
+
+    Decoded sessions are kept in a small per-process LRU and reused while the
+    row's ``version`` is unchanged, so image requests don't decode the whole
+    session every time. Each ``get`` builds a fresh session dict (and
+    generator) from the cached entry, so callers may change what they get.
+    ``last_used`` is refreshed at most every ``ttl / 10`` seconds to keep
+    reads from turning into writes.
+
+    A session from ``get`` remembers its row's ``version``, and ``put`` of it
+    only succeeds while the row is still at that version; otherwise it
+    returns False and ``update`` starts over from the newer row.
+    """
+
+    def __init__(self, path, max_sessions=5000, ttl=7 * 24 * 3600, decoded_cache_size=32):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._decoded = OrderedDict()
+        self._decoded_cache_size = decoded_cache_size
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS sessions ('
+                ' lid TEXT PRIMARY KEY, meta TEXT NOT NULL, layouts BLOB NOT NULL,'
+                ' version INTEGER NOT NULL, last_used REAL NOT NULL)'
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, lid):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute('SELECT version, last_used FROM sessions WHERE lid = ?',
+                               (lid,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                return None
+            version, last_used = row
+            if now - last_used > self.ttl / 10:
+                conn.execute('UPDATE sessions SET last_used = ? WHERE lid = ?', (now, lid))
+
+            with self._lock:
+                cached = self._decoded.get(lid)
+                if cached is not None and cached[0] == version:
+                    self._decoded.move_to_end(lid)
+            if cached is None or cached[0] != version:
+                row = conn.execute('SELECT meta, layouts, version FROM sessions WHERE lid = ?',
+                                   (lid,)).fetchone()
+                if row is None:
+                    return None
+                cached = (row[2],) + _decode_session(row[0], row[1])
+                self._remember(lid, cached)
+        data = _session_from(cached[1], cached[2])
+        data['version'] = cached[0]
+        return data
+
+    def put(self, lid, data):
+        """Store ``data``; False if it came from ``get`` and the session has
+        been stored again since"""
+        meta, blob = serialize_session(data)
+        now = time.time()
+        with self._connect() as conn:
+            if data.get('version') is None:
+                row = conn.execute('SELECT version FROM sessions WHERE lid = ?', (lid,)).fetchone()
+                version = row[0] + 1 if row else 1
+                conn.execute('INSERT OR REPLACE INTO sessions (lid, meta, layouts, version, last_used) '
+                             'VALUES (?, ?, ?, ?, ?)', (lid, meta, blob, version, now))
+            else:
+                version = data['version'] + 1
+                updated = conn.execute('UPDATE sessions SET meta = ?, layouts = ?, version = ?,'
+                                       ' last_used = ? WHERE lid = ? AND version = ?',
+                                       (meta, blob, version, now, lid, data['version'])).rowcount
+                if not updated:
+                    return False
+            conn.execute('DELETE FROM sessions WHERE last_used < ?', (now - self.ttl,))
+            conn.execute('DELETE FROM sessions WHERE lid IN ('
+                         ' SELECT lid FROM sessions ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                         (self.max_sessions,))
+        data['version'] = version
+        # Cache what was written, not the caller's dict, which it may keep changing
+        self._remember(lid, (version,) + _decode_session(meta, blob))
+        return True
+
+    def update(self, lid, change, attempts=5):
+        """``change(session)`` for session ``lid``, stored afterwards; returns
+        its result, or None if there is no such session. If another worker
+        stores the session first, ``change`` is applied again to its version."""
+        for _ in range(attempts):
+            data = self.get(lid)
+            if data is None:
+                return None
+            result = change(data)
+            if self.put(lid, data):
+                return result
+        raise SessionConflict(f"Session {lid} changed {attempts} times during an update")
+
+    def _remember(self, lid, entry):
+        with self._lock:
+            self._decoded[lid] = entry
+            self._decoded.move_to_end(lid)
+            while len(self._decoded) > self._decoded_cache_size:
+                self._decoded.popitem(last=False)
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+
+def make_session_store(spec):
+    """Store from a spec string: ``memory`` or ``sqlite:<path>``"""
+    if spec == 'memory':
+        return MemorySessionStore()
+    if spec.startswith('sqlite:'):
+        return SqliteSessionStore(spec[len('sqlite:'):])
+    raise ValueError(f"Unknown session store: {spec!r}")
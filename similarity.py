@@ -0,0 +1,102 @@
+"""Near-duplicate detection for layouts.
+
+Signatures only catch layouts that are equal after quantizing positions to
+5 units, so a room shifted by one cell counts as new. Here a layout is
+rasterised into a ``grid`` x ``grid`` occupancy map (empty, corridor or
+room, sampled at cell centres) and the distance between two layouts is the
+fraction of cells whose class differs.
+
+``SimilarityIndex`` finds layouts closer than ``min_distance`` without
+comparing against every stored layout, using locality-sensitive hashing by
+cell sampling: each of ``bands`` hash tables keys a layout by its classes at
+a fixed random set of cells. Two layouts at distance ``d`` share a band's
+key with probability ``(1 - d) ** cells_per_band``, and the band width is
+chosen so layouts at ``min_distance`` collide in a band about half the time.
+Candidates from any band are then checked exactly. Layouts that are too
+close can slip through only if they collide in no band: at ``min_distance``
+that chance is ``0.5 ** bands``, and it falls quickly for closer layouts.
+"""
+import math
+import random
+from operator import ne
+
+from allocate import CORRIDOR_WIDTH, CorridorType
+
+EMPTY, CORRIDOR, ROOM = 0, 1, 2
+
+
+def occupancy_grid(layout, plot_width, plot_height, grid=16):
+    """Row-major bytes of the cell classes of ``layout``"""
+    cells = bytearray(grid * grid)
+
+    def fill(x, y, w, h, value):
+        # Cells whose centre lies inside the rectangle
+        i0 = max(math.ceil(x * grid / plot_width - 0.5), 0)
+        i1 = min(math.ceil((x + w) * grid / plot_width - 0.5), grid)
+        j0 = max(math.ceil(y * grid / plot_height - 0.5), 0)
+        j1 = min(math.ceil((y + h) * grid / plot_height - 0.5), grid)
+        for j in range(j0, j1):
+            cells[j * grid + i0:j * grid + i1] = bytes([value]) * max(i1 - i0, 0)
+
+    for c in layout.corridors:
+        if c.type == CorridorType.VERTICAL:
+            fill(c.pos, c.start, CORRIDOR_WIDTH, c.end - c.start, CORRIDOR)
+        else:
+            fill(c.start, c.pos, c.end - c.start, CORRIDOR_WIDTH, CORRIDOR)
+    for spec, x, y, rotated in layout.iter_placements():
+        w, h = (spec.height, spec.width) if rotated else (spec.width, spec.height)
+        fill(x, y, w, h, ROOM)
+    return bytes(cells)
+
+
+def grid_distance(a, b):
+    """Fraction of cells that differ between two occupancy grids"""
+    return sum(map(ne, a, b)) / len(a)
+
+
+class SimilarityIndex:
+    def __init__(self, plot_width, plot_height, min_distance, grid=16, bands=10, seed=0):
+        self.plot_width = plot_width
+        self.plot_height = plot_height
+        self.min_distance = min_distance
+        self.grid = grid
+        cells = grid * grid
+        per_band = 1 if min_distance >= 0.5 else round(math.log(0.5) / math.log(1 - min_distance))
+        per_band = min(max(per_band, 1), cells)
+        rng = random.Random(seed)
+        self.bands = [sorted(rng.sample(range(cells), per_band)) for _ in range(bands)]
+        self.tables = [{} for _ in range(bands)]
+        self.grids = []
+
+    def _keys(self, cells):
+        return [bytes(cells[i] for i in band) for band in self.bands]
+
+    def nearest(self, layout):
+        """Distance to the closest indexed candidate (1.0 if there is none),
+        plus the layout's grid and band keys for ``add``"""
+        cells = occupancy_grid(layout, self.plot_width, self.plot_height, self.grid)
+        keys = self._keys(cells)
+        candidates = set()
+        for table, key in zip(self.tables, keys):
+            candidates.update(table.get(key, ()))
+        distance = min((grid_distance(cells, self.grids[k]) for k in candidates), default=1.0)
+        return distance, (cells, keys)
+
+    def add(self, layout, prepared=None):
+        cells, keys = prepared or self.nearest(layout)[1]
+        slot = len(self.grids)
+        self.grids.append(cells)
+        for table, key in zip(self.tables, keys):
+            table.setdefault(key, []).append(slot)
+
+    def admit(self, layout):
+        """Index ``layout`` and return True unless it is closer than
+        ``min_distance`` to one already indexed"""
+        distance, prepared = self.nearest(layout)
+        if distance < self.min_distance:
+            return False
+        self.add(layout, prepared)
+        return True
+
+    def __len__(self):
+        return len(self.grids)
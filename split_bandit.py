@@ -0,0 +1,102 @@
+"""Adaptive choice of the corridor split parameters.
+
+``recursively_split_zone`` is driven by three knobs: the maximum split depth,
+the base split probability (``split_base - depth * 0.15``) and the
+horizontal bias on even depths (odd depths use ``1 - h_bias``). The default
+search draws the depth from 3-5 and fixes the other two. Which settings pay
+off depends heavily on the room mix and plot size, so ``SplitBandit`` treats
+every combination in ``ARMS`` as an arm of a Bernoulli bandit. The reward is
+1 when an attempt yields a new unique layout. Arms are picked by Thompson
+sampling from Beta posteriors.
+
+A Thompson draw costs 24 beta variates, several times a cheap attempt, so
+one draw serves a block of ``BLOCK`` consecutive seeds. It is made at the
+first attempt the run reaches in the block, with a ``random.Random`` seeded
+from the block's first seed, and the posteriors depend only on earlier
+attempts. A serial run is therefore reproducible from its seed, and
+``to_state`` / ``from_state`` (which keep the current block's draw) resume
+it exactly.
+"""
+import random
+from itertools import product
+
+MAX_DEPTHS = (3, 4, 5)
+SPLIT_BASES = (0.35, 0.55, 0.75, 0.95)
+H_BIASES = (0.4, 0.6)
+
+# (max_depth, split_base, h_bias) per arm
+ARMS = tuple(product(MAX_DEPTHS, SPLIT_BASES, H_BIASES))
+
+# Consecutive seeds sharing one Thompson draw
+BLOCK = 16
+
+
+class SplitBandit:
+    def __init__(self, arms=ARMS, block=BLOCK):
+        self.arms = tuple(arms)
+        self.block = block
+        self.pulls = [0] * len(self.arms)
+        self.accepted = [0] * len(self.arms)
+        self.unique = [0] * len(self.arms)
+        self.drawn = None  # (first seed of the block, arm) of the current draw
+
+    def choose(self, seed):
+        """Index of the arm to use for the attempt with ``seed``"""
+        start = seed - seed % self.block
+        if self.drawn is None or self.drawn[0] != start:
+            rng = random.Random(f"split-bandit:{start}")
+            draws = [rng.betavariate(1 + self.unique[k], 1 + self.pulls[k] - self.unique[k])
+                     for k in range(len(self.arms))]
+            self.drawn = (start, max(range(len(self.arms)), key=draws.__getitem__))
+        return self.drawn[1]
+
+    def update(self, arm, accepted, unique):
+        self.pulls[arm] += 1
+        self.accepted[arm] += accepted
+        self.unique[arm] += unique
+
+    def rate(self, arm):
+        return self.unique[arm] / self.pulls[arm] if self.pulls[arm] else 0.0
+
+    def best(self):
+        """Arm with the highest posterior mean unique-layout rate"""
+        return max(range(len(self.arms)),
+                   key=lambda k: (1 + self.unique[k]) / (2 + self.pulls[k]))
+
+    def learned(self):
+        """The best arm's parameters and its observed rates"""
+        arm = self.best()
+        max_depth, split_base, h_bias = self.arms[arm]
+        pulls = self.pulls[arm]
+        return {
+            "max_depth": max_depth,
+            "split_base": split_base,
+            "h_bias": h_bias,
+            "pulls": pulls,
+            "acceptance_rate": self.accepted[arm] / pulls if pulls else 0.0,
+            "unique_rate": self.rate(arm),
+        }
+
+    def summary(self):
+        p = self.learned()
+        total = sum(self.pulls)
+        overall = sum(self.unique) / total if total else 0.0
+        return (f"Learned split parameters: max_depth={p['max_depth']}, "
+                f"split_base={p['split_base']}, h_bias={p['h_bias']} "
+                f"({p['unique_rate']:.1%} new layouts over {p['pulls']} attempts; "
+                f"{overall:.1%} over all {total})")
+
+    def to_state(self):
+        return {"arms": [list(arm) for arm in self.arms], "block": self.block,
+                "drawn": self.drawn and list(self.drawn), "pulls": self.pulls,
+                "accepted": self.accepted, "unique": self.unique}
+
+    @classmethod
+    def from_state(cls, state):
+        # States saved before draws were shared drew once per attempt
+        bandit = cls((tuple(arm) for arm in state["arms"]), state.get("block", 1))
+        bandit.drawn = state.get("drawn") and tuple(state["drawn"])
+        bandit.pulls = list(state["pulls"])
+        bandit.accepted = list(state["accepted"])
+        bandit.unique = list(state["unique"])
+        return bandit
@@ -0,0 +1,277 @@
+"""Batch CLI: generate layouts for many floor programs in one run.
+
+    python sweep.py programs.jsonl -o results.jsonl --jobs 8 --time-budget 2
+
+Each input line (JSONL) is one job::
+
+    {"id": "a1", "plot_width": 40, "plot_height": 30, "rooms": [[10, 12], [15, 8]],
+     "max_layouts": 20, "seed": 3}
+
+``rooms`` holds ``[width, height]`` pairs or ``{"id", "width", "height"}``
+objects (ids default to 1, 2, ...). ``max_layouts``, ``max_attempts``,
+``time_budget``, ``seed``, ``min_rooms``, ``packer`` and ``min_distance`` are
+optional and default to the command line values. CSV input has a header row
+with the same names, and ``rooms`` written as ``10x12 15x8``.
+
+Jobs run on ``--jobs`` worker processes, with at most two jobs per worker
+in flight, so a file of any size streams through in constant memory.
+Results are written as one JSON line per job, in input order, as soon as
+that job and the ones before it are done. Nothing is rendered unless
+``--render`` is given, and matplotlib is never imported.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from allocate import PACKERS, LayoutGenerator, Room
+from generation_stats import STAGES, GenerationStats
+
+# Per-job settings a spec may override, with the command line flag's type
+JOB_SETTINGS = {
+    'max_layouts': int,
+    'max_attempts': int,
+    'time_budget': float,
+    'seed': int,
+    'min_rooms': int,
+    'packer': str,
+    'min_distance': float,
+}
+
+
+def parse_rooms(value):
+    """Rooms from a JSON list of pairs/objects or a ``WxH WxH`` string"""
+    if isinstance(value, str):
+        value = [[int(side) for side in part.split('x')]
+                 for part in re.split(r'[\s;]+', value.strip()) if part]
+    rooms = []
+    for i, room in enumerate(value, 1):
+        if isinstance(room, dict):
+            rooms.append(Room(int(room.get('id', i)), int(room['width']), int(room['height'])))
+        else:
+            width, height = room
+            rooms.append(Room(i, int(width), int(height)))
+    if not rooms:
+        raise ValueError("no rooms")
+    return rooms
+
+
+def read_specs(path, fmt=None):
+    """Yield ``(line number, raw spec)`` from a JSONL or CSV file (``fmt``
+    defaults to the file extension; '-' reads JSONL from stdin). JSONL specs
+    are left as text to be parsed per job, so one bad line fails only its job."""
+    fmt = fmt or ('csv' if path.endswith('.csv') else 'jsonl')
+    f = sys.stdin if path == '-' else open(path, newline='')
+    try:
+        if fmt == 'csv':
+            for number, row in enumerate(csv.DictReader(f), 2):
+                yield number, {key: value for key, value in row.items() if value not in (None, '')}
+        else:
+            for number, line in enumerate(f, 1):
+                if line.strip():
+                    yield number, line
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def make_job(raw, defaults, number):
+    """Validated job dict from a raw spec and the command line defaults"""
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    if not isinstance(raw, dict):
+        raise ValueError("a job must be a JSON object")
+    job = dict(defaults)
+    job['id'] = str(raw.get('id', number))
+    job['plot_width'] = int(raw['plot_width'])
+    job['plot_height'] = int(raw['plot_height'])
+    job['rooms'] = [(r.id, r.width, r.height) for r in parse_rooms(raw['rooms'])]
+    for key, kind in JOB_SETTINGS.items():
+        if raw.get(key) is not None:
+            job[key] = kind(raw[key])
+    if job['packer'] not in PACKERS:
+        raise ValueError(f"unknown packer {job['packer']!r}")
+    return job
+
+
+def encode_layout(layout):
+    return {
+        "area": layout.get_room_area(),
+        "rooms": [[spec.id, x, y, int(rotated)] for spec, x, y, rotated in layout.iter_placements()],
+        "corridors": [[c.pos, c.type.name, c.start, c.end] for c in layout.corridors],
+    }
+
+
+def stats_summary(stats):
+    return {
+        "attempts": stats.attempts,
+        "outcomes": stats.outcomes,
+        "duplicates": stats.duplicates,
+        "near_duplicates": stats.near_duplicates,
+        "stage_mean_us": {stage: stats.timings[stage].mean() * 1e6 for stage in STAGES},
+        "wall_time": stats.wall_time,
+    }
+
+
+def render_layouts(job, layouts, render, render_dir):
+    from fast_render import layout_to_png, layout_to_svg
+
+    os.makedirs(render_dir, exist_ok=True)
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', job['id'])
+    paths = []
+    for k, layout in enumerate(layouts, 1):
+        path = os.path.join(render_dir, f"{name}_{k:02d}.{render}")
+        if render == 'svg':
+            with open(path, 'w') as f:
+                f.write(layout_to_svg(layout, job['plot_width'], job['plot_height']))
+        else:
+            with open(path, 'wb') as f:
+                f.write(layout_to_png(layout, job['plot_width'], job['plot_height']))
+        paths.append(path)
+    return paths
+
+
+def run_job(job, with_stats=False, render=None, render_dir='.'):
+    """Worker entry point: search one job and return its result record"""
+    start = time.perf_counter()
+    stats = GenerationStats() if with_stats else None
+    rooms = [Room(*room) for room in job['rooms']]
+    generator = LayoutGenerator(rooms, job['plot_width'], job['plot_height'], seed=job['seed'],
+                                min_rooms=job['min_rooms'], packer=job['packer'], stats=stats,
+                                min_distance=job['min_distance'])
+    budget = job['time_budget']
+    deadline = None if budget is None else time.monotonic() + budget
+    layouts = []
+
+    def collect():
+        for layout in generator.iter(job['max_attempts'], deadline):
+            layouts.append(layout)
+            if len(layouts) >= job['max_layouts']:
+                break
+
+    if stats is None:
+        collect()
+    else:
+        with stats.measure():
+            collect()
+
+    result = {
+        "id": job['id'],
+        "status": "ok",
+        "plot_width": job['plot_width'],
+        "plot_height": job['plot_height'],
+        "attempts": generator.attempts,
+        "timed_out": (deadline is not None and len(layouts) < job['max_layouts'] and
+                      generator.attempts < job['max_attempts']),
+        "elapsed": time.perf_counter() - start,
+        "layouts": [encode_layout(layout) for layout in layouts],
+    }
+    if stats is not None:
+        result["stats"] = stats_summary(stats)
+    if render:
+        result["images"] = render_layouts(job, layouts, render, render_dir)
+    return result
+
+
+def run_safely(job, with_stats, render, render_dir):
+    try:
+        return run_job(job, with_stats, render, render_dir)
+    except Exception as exc:
+        return {"id": job['id'], "status": "error", "error": f"{type(exc).__name__}: {exc}"}
+
+
+def iter_jobs(specs, defaults):
+    """``(job, None)`` per valid spec and ``(None, error record)`` per invalid one"""
+    for number, raw in specs:
+        try:
+            # Parsed here rather than in make_job so an invalid spec's error
+            # record still carries its id
+            if isinstance(raw, str):
+                raw = json.loads(raw)
+            yield make_job(raw, defaults, number), None
+        except (KeyError, TypeError, ValueError) as exc:
+            error = f"line {number}: {type(exc).__name__}: {exc}"
+            job_id = raw.get('id', number) if isinstance(raw, dict) else number
+            yield None, {"id": str(job_id), "status": "error", "error": error}
+
+
+def sweep(specs, defaults, out, jobs=1, with_stats=False, render=None, render_dir='.'):
+    """Run every spec, writing one JSON line per job to ``out`` in input order.
+    Returns ``(succeeded, failed)`` counts."""
+    counts = {"ok": 0, "error": 0}
+
+    def emit(result):
+        counts[result["status"]] += 1
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+        done = counts["ok"] + counts["error"]
+        if done % 100 == 0:
+            print(f"  {done} jobs done, {counts['error']} failed", file=sys.stderr)
+
+    if jobs <= 1:
+        for job, error in iter_jobs(specs, defaults):
+            emit(error or run_safely(job, with_stats, render, render_dir))
+        return counts["ok"], counts["error"]
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for job, error in iter_jobs(specs, defaults):
+            if error is None:
+                pending.append(pool.submit(run_safely, job, with_stats, render, render_dir))
+            else:
+                pending.append(error)
+            # Keep two jobs per worker in flight and write results in order;
+            # error records for invalid specs go out as soon as they are first
+            while len(pending) > jobs * 2 or (pending and isinstance(pending[0], dict)):
+                head = pending.popleft()
+                emit(head if isinstance(head, dict) else head.result())
+        while pending:
+            head = pending.popleft()
+            emit(head if isinstance(head, dict) else head.result())
+    return counts["ok"], counts["error"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate layouts for many floor programs")
+    parser.add_argument('input', help="JSONL or CSV file of jobs ('-' for JSONL on stdin)")
+    parser.add_argument('-o', '--output', default='-', help="JSONL results file (default: stdout)")
+    parser.add_argument('--format', choices=['jsonl', 'csv'],
+                        help="input format (default: from the file extension)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument('--max-layouts', type=int, default=10)
+    parser.add_argument('--max-attempts', type=int, default=500)
+    parser.add_argument('--time-budget', type=float, metavar='SECONDS',
+                        help="per-job search time limit")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-rooms', type=int, default=1)
+    parser.add_argument('--packer', choices=sorted(PACKERS), default='greedy')
+    parser.add_argument('--min-distance', type=float, metavar='FRACTION')
+    parser.add_argument('--stats', action='store_true',
+                        help="add per-job attempt outcomes and stage timings to the results")
+    parser.add_argument('--render', choices=['svg', 'png'],
+                        help="also write each layout as an image (no matplotlib)")
+    parser.add_argument('--render-dir', default='.', help="directory for --render images")
+    args = parser.parse_args()
+
+    defaults = {key: getattr(args, key) for key in JOB_SETTINGS}
+    start = time.perf_counter()
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        ok, failed = sweep(read_specs(args.input, args.format), defaults, out, args.jobs,
+                           args.stats, args.render, args.render_dir)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"{ok + failed} jobs in {time.perf_counter() - start:.1f}s: {ok} ok, {failed} failed",
+          file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Regression checks for the guarantees the search makes.
+
+    python -m pytest -q
+"""
+import json
+import random
+import time
+
+import pytest
+
+from allocate import (LayoutGenerator, PACKERS, Room, _layout_rank, _load_signature,
+                      generate_layouts, room_specs, search_until)
+from split_bandit import BLOCK, SplitBandit
+
+DEMO = [Room(1, 10, 12), Room(2, 15, 8), Room(3, 7, 14), Room(4, 20, 10), Room(5, 12, 12)]
+
+
+def random_rooms(count, low, high, seed=0):
+    rng = random.Random(seed)
+    return [Room(i + 1, rng.randint(low, high), rng.randint(low, high)) for i in range(count)]
+
+
+def signatures(layouts):
+    return [layout.get_signature() for layout in layouts]
+
+
+@pytest.mark.parametrize('min_distance', [None, 0.1])
+def test_parallel_matches_serial(min_distance):
+    rooms = random_rooms(12, 4, 14)
+    for seed in (0, 7, 123):
+        serial = generate_layouts(rooms, 60, 50, max_layouts=15, max_attempts=300, seed=seed,
+                                  min_distance=min_distance)
+        for workers in (2, 3):
+            parallel = generate_layouts(rooms, 60, 50, max_layouts=15, max_attempts=300,
+                                        seed=seed, workers=workers, min_distance=min_distance)
+            assert signatures(parallel) == signatures(serial)
+
+
+def test_indexed_packer_matches_greedy():
+    rng = random.Random(1)
+    for _ in range(200):
+        specs = room_specs(random_rooms(rng.randint(1, 40), 2, 30, seed=rng.random()))
+        width, height = rng.randint(5, 200), rng.randint(5, 200)
+        remaining = list(range(len(specs)))
+        greedy = PACKERS['greedy'](specs, remaining, 3, 4, width, height, False, None)
+        indexed = PACKERS['indexed'](specs, remaining, 3, 4, width, height, False, None)
+        assert indexed == greedy
+
+
+@pytest.mark.parametrize('options', [{}, {'min_distance': 0.1}, {'adaptive': True},
+                                     {'packer': 'exact', 'min_rooms': 3}])
+def test_generator_state_round_trip(options):
+    generator = LayoutGenerator(DEMO, 40, 40, seed=3, **options)
+    found = generator.next(5)
+    state = json.loads(json.dumps(generator.to_state()))
+    resumed = LayoutGenerator.from_state(state)
+    if resumed.index is not None:
+        # The similarity index is not part of the state; rebuild it as "Load more" does
+        resumed.remember(found)
+    assert resumed.seen_signatures == generator.seen_signatures
+    assert (resumed.next_seed, resumed.attempts) == (generator.next_seed, generator.attempts)
+    assert signatures(resumed.next(5)) == signatures(generator.next(5))
+
+
+def test_exact_packer_places_at_least_as_many_rooms():
+    rng = random.Random(2)
+    for _ in range(200):
+        specs = room_specs(random_rooms(rng.randint(1, 7), 2, 20, seed=rng.random()))
+        width, height = rng.randint(5, 40), rng.randint(5, 40)
+        remaining = list(range(len(specs)))
+        greedy, _ = PACKERS['greedy'](specs, remaining, 0, 0, width, height, False, None)
+        exact, unplaced = PACKERS['exact'](specs, remaining, 0, 0, width, height, False, None)
+        assert len(exact) >= len(greedy)
+        assert sorted([i for i, _, _, _ in exact] + unplaced) == remaining
+        for i, x, y, rotated in exact:
+            w, h = (specs[i].height, specs[i].width) if rotated else (specs[i].width, specs[i].height)
+            assert x + w <= width and y + h <= height
+
+
+def test_bandit_draw_is_shared_per_block():
+    bandit = SplitBandit()
+    arm = bandit.choose(BLOCK)
+    for seed in range(BLOCK, 2 * BLOCK):
+        assert bandit.choose(seed) == arm
+        bandit.update(arm, True, seed % 3 == 0)
+    # A run resumed mid-block keeps the block's draw
+    resumed = SplitBandit.from_state(json.loads(json.dumps(bandit.to_state())))
+    assert resumed.choose(2 * BLOCK - 1) == arm
+    assert resumed.choose(2 * BLOCK) == bandit.choose(2 * BLOCK)
+    # States saved before draws were shared drew once per attempt
+    legacy = {key: value for key, value in bandit.to_state().items()
+              if key not in ('block', 'drawn')}
+    assert SplitBandit.from_state(legacy).block == 1
+
+
+def test_legacy_signatures_load():
+    generator = LayoutGenerator(DEMO, 40, 40)
+    layout = generator.next(1)[0]
+    # States written before 64-bit signatures stored positions quantized to 5 units
+    legacy = [sorted([spec.id, x // 5, y // 5, int(rotated)]
+                     for spec, x, y, rotated in layout.iter_placements()),
+              sorted([c.pos // 5, c.type.value] for c in layout.corridors)]
+    state = generator.to_state()
+    state['seen_signatures'] = [json.loads(json.dumps(legacy))]
+    assert _load_signature(state['seen_signatures'][0]) == layout.get_signature()
+    assert LayoutGenerator.from_state(state).seen_signatures == {layout.get_signature()}
+
+
+def test_batch_engine_layouts():
+    rooms = random_rooms(12, 4, 14)
+    layouts = generate_layouts(rooms, 60, 50, max_layouts=20, max_attempts=2000, engine='batch')
+    assert layouts
+    assert signatures(layouts) == signatures(
+        generate_layouts(rooms, 60, 50, max_layouts=20, max_attempts=2000, engine='batch'))
+    for layout in layouts:
+        assert layout.get_room_area() <= 60 * 50 * 0.7
+        for spec, x, y, rotated in layout.iter_placements():
+            w, h = (spec.height, spec.width) if rotated else (spec.width, spec.height)
+            assert 0 <= x and x + w <= 60 and 0 <= y and y + h <= 50
+    with pytest.raises(ValueError):
+        generate_layouts(rooms, 60, 50, engine='batch', min_distance=0.1)
+
+
+def test_search_until_keeps_best_so_far_at_deadline():
+    # 40 rooms of this size never all fit, so only the deadline ends the search
+    generator = LayoutGenerator(random_rooms(40, 6, 14), 60, 50)
+    published = []
+    layouts, deadline_hit = search_until(generator, 5, time.monotonic() + 0.1,
+                                         on_improve=published.append)
+    assert deadline_hit
+    assert 0 < len(layouts) <= 5
+    assert generator.attempts > len(layouts)
+    ranks = [_layout_rank(layout) for layout in layouts]
+    assert ranks == sorted(ranks, reverse=True)
+    assert published and published[-1] == layouts
+    assert generator.min_rooms == 1
+
+
+@pytest.mark.parametrize('max_layouts', [0, -1])
+def test_search_until_without_layouts_to_keep(max_layouts):
+    generator = LayoutGenerator(DEMO, 40, 40)
+    assert search_until(generator, max_layouts, time.monotonic() + 10) == ([], False)
+    assert generator.attempts == 0
@@ -0,0 +1,60 @@
+"""Image routes: ETag revalidation and parameter checks.
+
+    python -m pytest -q
+"""
+import pytest
+
+import gui_flask
+from allocate import LayoutGenerator
+from test_allocate import DEMO
+
+
+@pytest.fixture
+def client(monkeypatch):
+    generator = LayoutGenerator(DEMO, 40, 40)
+    gui_flask.SESSIONS.put('test-session', {
+        'layouts': generator.next(2), 'plot_w': 40, 'plot_h': 40, 'rooms': DEMO, 'seed': 0,
+        'max_attempts': 100, 'generator': generator})
+    monkeypatch.setattr(gui_flask, 'RENDER_CACHE', gui_flask.RenderCache())
+    return gui_flask.app.test_client()
+
+
+def test_image_revalidates_with_etag(client, monkeypatch):
+    renders = []
+    layout_to_png = gui_flask.layout_to_png
+
+    def counted(*args):
+        renders.append(args)
+        return layout_to_png(*args)
+
+    monkeypatch.setattr(gui_flask, 'layout_to_png', counted)
+    url = '/image/test-session/0.png?renderer=raster&size=2'
+
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.data.startswith(b'\x89PNG')
+    assert first.headers['Cache-Control'] == 'public, max-age=86400'
+    etag = first.headers['ETag']
+
+    again = client.get(url, headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers['ETag'] == etag
+
+    # Another size is another image
+    other = client.get('/image/test-session/0.png?renderer=raster&size=3',
+                       headers={'If-None-Match': etag})
+    assert other.status_code == 200
+    assert other.headers['ETag'] != etag
+    assert len(renders) == 2
+
+
+@pytest.mark.parametrize('query', ['size=big', 'size=nan', 'size=inf', 'dpi=1.5',
+                                   'renderer=gif'])
+def test_image_rejects_bad_parameters(client, query):
+    assert client.get(f'/image/test-session/0.png?{query}').status_code == 400
+
+
+def test_image_of_unknown_layout_is_404(client):
+    assert client.get('/image/test-session/5.png').status_code == 404
+    assert client.get('/image/no-such-session/0.png').status_code == 404
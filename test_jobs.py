@@ -0,0 +1,96 @@
+"""Background jobs: progress while they run and the per-owner limits.
+
+    python -m pytest -q
+"""
+import time
+
+import pytest
+
+from allocate import cache_key
+from jobs import CANCELLED, DONE, FINISHED, Job, JobQueue
+from layout_cache import LayoutCache
+from test_allocate import random_rooms, signatures
+
+
+def wait_for(condition, timeout=10):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.005)
+
+
+def endless_job(owner=None):
+    # These rooms never all fit, so the job runs until cancelled or out of time
+    return Job(random_rooms(40, 6, 14), 60, 50, max_layouts=5, max_attempts=10 ** 6,
+               deadline_ms=10000, owner=owner)
+
+
+def test_deadline_job_publishes_layouts_while_running():
+    job = endless_job()
+    queue = JobQueue(workers=1)
+    queue.submit(job)
+    wait_for(lambda: job.layouts)
+    assert job.status not in FINISHED
+    assert job.progress()['layouts'] > 0
+    queue.cancel(job.id)
+    wait_for(lambda: job.status in FINISHED)
+    assert job.status == CANCELLED
+    assert job.layouts
+
+
+@pytest.mark.parametrize('min_distance', [None, 0.1])
+def test_cached_job_resumes_where_the_search_stopped(tmp_path, min_distance):
+    cache = LayoutCache(str(tmp_path / 'cache.sqlite'))
+    rooms = random_rooms(12, 4, 14)
+    jobs = []
+    for _ in range(2):
+        job = Job(rooms, 60, 50, max_layouts=10, max_attempts=500, cache=cache,
+                  min_distance=min_distance)
+        job.run()
+        assert job.status == DONE
+        jobs.append(job)
+    searched, cached = jobs
+    assert signatures(cached.layouts) == signatures(searched.layouts)
+    assert cached.generator.next_seed == searched.generator.next_seed < 500
+    # "Load more" continues from the generator either way
+    assert signatures(cached.generator.next(10)) == signatures(searched.generator.next(10))
+
+
+def test_cache_entry_without_resume_point_is_searched_again(tmp_path):
+    cache = LayoutCache(str(tmp_path / 'cache.sqlite'))
+    rooms = random_rooms(12, 4, 14)
+    job = Job(rooms, 60, 50, max_layouts=10, max_attempts=500, cache=cache)
+    job.run()
+    # As the CLI stores it
+    key = cache_key(cache, rooms, 60, 50, 10, 500, 0)
+    cache.put(key, job.layouts)
+    again = Job(rooms, 60, 50, max_layouts=10, max_attempts=500, cache=cache)
+    again.run()
+    assert again.generator.attempts == job.generator.attempts
+    assert cache.get_entry(key, rooms)[1] == {'next_seed': job.generator.next_seed,
+                                              'attempts': job.generator.attempts}
+
+
+def test_queue_caps_unfinished_jobs_per_owner():
+    queue = JobQueue(workers=1, max_per_owner=2)
+    running, queued = endless_job('a'), endless_job('a')
+    other = endless_job('b')
+    try:
+        assert queue.submit(running) and queue.submit(queued)
+        assert not queue.submit(endless_job('a'))
+        assert queue.submit(other)
+        # A streamed search counts against the same cap
+        assert not queue.hold('a')
+        queue.cancel(running.id)
+        wait_for(lambda: running.status in FINISHED)
+        assert queue.hold('a')
+        assert not queue.submit(endless_job('a'))
+        queue.release('a')
+        assert queue.hold('a') and queue.hold('b')
+        queue.release('a')
+        queue.release('b')
+    finally:
+        for job in (running, queued, other):
+            queue.cancel(job.id)
+    wait_for(lambda: all(job.status in FINISHED for job in (running, queued, other)))
+    assert queue.counts()[CANCELLED] == 3
@@ -0,0 +1,25 @@
+"""Exported layout batches load back unchanged.
+
+    python -m pytest -q
+"""
+import pytest
+
+from allocate import generate_layouts
+from layout_export import export_layouts, load_layouts
+from test_allocate import random_rooms
+
+
+@pytest.mark.parametrize('name', ['batch', 'batch.npz'])
+def test_export_round_trip(tmp_path, name):
+    layouts = generate_layouts(random_rooms(20, 4, 16), 100, 80, max_layouts=10, max_attempts=200)
+    assert layouts
+    path = tmp_path / name
+    export_layouts(layouts, str(path), 100, 80)
+    batch = load_layouts(str(path))
+    assert (batch.plot_width, batch.plot_height) == (100, 80)
+    assert len(batch) == len(layouts)
+    for loaded, layout in zip(batch, layouts):
+        assert list(loaded.iter_placements()) == list(layout.iter_placements())
+        assert ([(c.pos, c.type, c.start, c.end) for c in loaded.corridors] ==
+                [(c.pos, c.type, c.start, c.end) for c in layout.corridors])
+        assert loaded.get_signature() == layout.get_signature()
@@ -0,0 +1,64 @@
+"""Version-checked writes of the SQLite session store.
+
+    python -m pytest -q
+"""
+import pytest
+
+from allocate import LayoutGenerator
+from session_store import SessionConflict, SqliteSessionStore
+from test_allocate import DEMO, signatures
+
+
+def new_session():
+    generator = LayoutGenerator(DEMO, 40, 40)
+    return {'layouts': generator.next(3), 'plot_w': 40, 'plot_h': 40, 'rooms': DEMO, 'seed': 0,
+            'max_attempts': 150, 'generator': generator}
+
+
+@pytest.fixture
+def stores(tmp_path):
+    """Two stores on one file, as two gunicorn workers would have"""
+    path = str(tmp_path / 'sessions.sqlite')
+    store = SqliteSessionStore(path)
+    store.put('s', new_session())
+    return store, SqliteSessionStore(path)
+
+
+def test_put_of_a_stale_session_fails(stores):
+    first, second = stores
+    mine, theirs = first.get('s'), second.get('s')
+    theirs['layouts'].extend(theirs['generator'].next(2))
+    assert second.put('s', theirs)
+    mine['layouts'] = []
+    assert not first.put('s', mine)
+    assert len(first.get('s')['layouts']) == 5
+
+
+def test_update_reapplies_the_change_after_a_conflict(stores):
+    first, second = stores
+    calls = []
+
+    def load_more(data):
+        if not calls:
+            # Another worker stores the session between our read and write
+            second.update('s', lambda theirs: theirs['layouts'].extend(theirs['generator'].next(2)))
+        calls.append(len(data['layouts']))
+        data['layouts'].extend(data['generator'].next(2))
+        return len(data['layouts'])
+
+    assert first.update('s', load_more) == 7
+    assert calls == [3, 5]
+    data = second.get('s')
+    assert len(set(signatures(data['layouts']))) == 7
+    assert data['generator'].next_seed == first.get('s')['generator'].next_seed
+
+
+def test_update_gives_up_when_the_session_keeps_changing(stores):
+    first, second = stores
+
+    def change(data):
+        second.put('s', second.get('s'))
+
+    with pytest.raises(SessionConflict):
+        first.update('s', change, attempts=3)
+    assert first.update('missing', change) is None
@@ -0,0 +1,16 @@
+"""Import time and heavy imports of the entry points, each in a fresh
+interpreter (see ``bench.py startup``).
+
+    python -m pytest -q
+"""
+import pytest
+
+from bench import STARTUP_BUDGET_MS, measure_import
+
+
+@pytest.mark.parametrize('module', sorted(STARTUP_BUDGET_MS))
+def test_import_stays_within_budget(module):
+    budget, forbidden = STARTUP_BUDGET_MS[module]
+    elapsed, loaded = measure_import(module, runs=3)
+    assert not [name for name in loaded if name in forbidden]
+    assert elapsed <= budget